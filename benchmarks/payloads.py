@@ -0,0 +1,50 @@
+# Purpose:  Synthetic Veracode XML payloads for benchmarks
+
+import random
+
+SEVERITIES = ["0", "1", "2", "3", "4", "5"]
+CATEGORIES = ["Command Injection", "Cross-Site Scripting", "SQL Injection", "Information Leakage",
+              "Cryptographic Issues", "Directory Traversal", "Credentials Management", "CRLF Injection"]
+STATUSES = ["New", "Open", "Fixed", "Reopened"]
+MITIGATIONS = ["Not Mitigated", "Mitigation Proposed", "Mitigation Accepted"]
+
+
+def detailed_report(flaw_count, build_type="static", seed=0):
+    """Returns a detailed report holding flaw_count flaws, spread over a realistic number of categories and files"""
+    rng = random.Random(seed)
+    flaws = []
+    for issueid in rng.sample(range(1, flaw_count * 4 + 1), flaw_count):
+        attributes = ('issueid="{}" date_first_occurrence="2017-{:02d}-01 00:00:00 UTC" severity="{}" cweid="{}" '
+                      'categoryname="{}" affects_policy_compliance="{}" remediationeffort="{}" remediation_status="{}" '
+                      'mitigation_status_desc="{}"').format(issueid, rng.randint(1, 12), rng.choice(SEVERITIES),
+                                                           rng.randint(1, 900), rng.choice(CATEGORIES),
+                                                           rng.choice(["true", "false"]), rng.randint(1, 5),
+                                                           rng.choice(STATUSES), rng.choice(MITIGATIONS))
+        if build_type == "static":
+            attributes += ' exploitLevel="{}" module="module-{}.war" sourcefile="com/example/File{}.java" line="{}"'.format(
+                rng.randint(-2, 2), rng.randint(1, 20), rng.randint(1, 2000), rng.randint(1, 3000))
+        else:
+            attributes += ' url="https://example.com/path/{}"'.format(rng.randint(1, 500))
+        flaws.append("<flaw {}/>".format(attributes))
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<detailedreport xmlns="https://www.veracode.com/schema/reports/export/1.0">\n'
+            '<severity level="5"><category categoryname="All"><cwe cweid="0"><{0}flaws>\n'
+            '{1}\n'
+            '</{0}flaws></cwe></category></severity>\n'
+            '<static-analysis analysis_size_bytes="1048576"/>\n'
+            '</detailedreport>').format(build_type, "\n".join(flaws)).encode("utf-8")
+
+
+def build_list(build_count):
+    """Returns a build list holding build_count published builds, every fifth one dynamic"""
+    builds = []
+    for build_id in range(1, build_count + 1):
+        dynamic = ' dynamic_scan_type="da"' if build_id % 5 == 0 else ""
+        builds.append('<build build_id="{0}" version="build-{0}" policy_updated_date="2017-01-01T00:00:00-05:00"{1}/>'
+                      .format(build_id, dynamic))
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<buildlist xmlns="https://analysiscenter.veracode.com/schema/2.0/buildlist">\n'
+            '{}\n'
+            '</buildlist>').format("\n".join(builds)).encode("utf-8")
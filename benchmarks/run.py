@@ -0,0 +1,174 @@
+# Purpose:  Micro-benchmarks for the parsing, modelling and CSV writing hot paths. Runs offline on synthetic payloads.
+#
+# Notes:    python -m benchmarks.run --flaws 50000 --output bench_results.json
+#           python -m benchmarks.run --compare bench_results.json
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import gc
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, peak memory is not measured
+    tracemalloc = None
+
+from veracodetocsv.helpers import models
+from veracodetocsv.helpers import unicodecsv
+from veracodetocsv.helpers.data import DataLoader, parse_and_remove_xml_namespaces
+from veracodetocsv.helpers.projection import Projection
+from benchmarks import payloads
+
+
+class PayloadAPI:
+    """Stands in for VeracodeAPI, returning synthetic payloads"""
+    def __init__(self, report_xml, build_list_xml):
+        self.report_xml = report_xml
+        self.build_list_xml = build_list_xml
+
+    def get_detailed_report(self, build_id):
+        return self.report_xml
+
+    def get_build_list(self, app_id, sandbox_id=None):
+        return self.build_list_xml
+
+
+class Benchmark(object):
+    """A class that represents one timed hot path. setup() returns the function to time."""
+    def __init__(self, name, items, setup):
+        self.name = name
+        self.items = items
+        self.setup = setup
+
+    def run(self, repeat):
+        timings = []
+        for _ in range(repeat):
+            function = self.setup()
+            gc.collect()
+            start = default_timer()
+            function()
+            timings.append(default_timer() - start)
+
+        peak_memory = None
+        retained_memory = None
+        if tracemalloc is not None:
+            function = self.setup()
+            gc.collect()
+            tracemalloc.start()
+            result = function()
+            # Memory still held by the result, e.g. flaw objects once the parsed report has been released
+            retained_memory, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+
+        best = min(timings)
+        return {"seconds": best,
+                "median_seconds": sorted(timings)[len(timings) // 2],
+                "items": self.items,
+                "items_per_second": self.items / best if best > 0 else None,
+                "peak_memory_bytes": peak_memory,
+                "retained_memory_bytes": retained_memory}
+
+
+def make_benchmarks(flaw_count, build_count, output_directory):
+    report_xml = payloads.detailed_report(flaw_count)
+    build_list_xml = payloads.build_list(build_count)
+    api = PayloadAPI(report_xml, build_list_xml)
+    app = models.App("1", "benchmark-app", "benchmark")
+    build = models.StaticBuild("1", "benchmark-build", datetime(2017, 1, 1), datetime(2017, 1, 1), "1048576")
+    build.flaws = DataLoader(api, None)._get_flaws(build.id, "static")[0]
+    rows = [app.to_list() + build.to_list() + flaw.to_list() for flaw in build.flaws]
+    row_extractor = Projection().row_extractor("static")
+    csv_path = os.path.join(output_directory, "benchmark.csv")
+
+    return [
+        Benchmark("parse_and_remove_xml_namespaces", flaw_count,
+                  lambda: lambda: parse_and_remove_xml_namespaces(report_xml)),
+        Benchmark("get_flaws", flaw_count,
+                  lambda: lambda: DataLoader(api, None)._get_flaws("1", "static")),
+        Benchmark("get_flaws_flaw_table", flaw_count,
+                  lambda: lambda: DataLoader(api, None, flaw_table_threshold=0)._get_flaws("1", "static")),
+        Benchmark("get_builds", build_count,
+                  lambda: lambda: DataLoader(api, None)._get_builds("1", True, True)),
+        Benchmark("to_list_rows", flaw_count,
+                  lambda: lambda: [app.to_list() + build.to_list() + flaw.to_list() for flaw in build.flaws]),
+        Benchmark("row_extractor_rows", flaw_count,
+                  lambda: lambda: list(row_extractor.rows(app, build))),
+        Benchmark("create_csv", flaw_count,
+                  lambda: lambda: unicodecsv.create_csv(rows, csv_path)),
+    ]
+
+
+def compare(results, baseline):
+    """Returns lines comparing results against a baseline results file"""
+    lines = []
+    for name, result in sorted(results["results"].items()):
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None or not baseline_result["seconds"]:
+            lines.append("{}: no baseline".format(name))
+            continue
+        lines.append("{}: {:.2f}x baseline time".format(name, result["seconds"] / baseline_result["seconds"]))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times the parsing, modelling and CSV writing hot paths")
+    parser.add_argument("--flaws", help="Number of flaws in the synthetic detailed report", type=int, default=20000)
+    parser.add_argument("--builds", help="Number of builds in the synthetic build list", type=int, default=2000)
+    parser.add_argument("--repeat", help="Number of timed runs per benchmark, the best is reported", type=int, default=5)
+    parser.add_argument("--only", help="Comma separated list of benchmarks to run")
+    parser.add_argument("-o", "--output", help="JSON file to save results to")
+    parser.add_argument("--compare", help="JSON results file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    output_directory = tempfile.mkdtemp()
+    try:
+        benchmarks = make_benchmarks(args.flaws, args.builds, output_directory)
+        if args.only:
+            benchmarks = [benchmark for benchmark in benchmarks if benchmark.name in args.only.split(",")]
+
+        results = {"python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "date": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+                   "flaws": args.flaws,
+                   "builds": args.builds,
+                   "repeat": args.repeat,
+                   "results": {}}
+        for benchmark in benchmarks:
+            result = benchmark.run(args.repeat)
+            results["results"][benchmark.name] = result
+            print("{:<32} {:>10.4f}s {:>12.0f} items/s {:>10} KB peak {:>10} KB retained".format(
+                benchmark.name, result["seconds"], result["items_per_second"] or 0,
+                result["peak_memory_bytes"] // 1024 if result["peak_memory_bytes"] is not None else "-",
+                result["retained_memory_bytes"] // 1024 if result["retained_memory_bytes"] is not None else "-"))
+    finally:
+        shutil.rmtree(output_directory)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        for line in compare(results, baseline):
+            print(line)
+
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+
+import time
+
+import pytest
+
+from veracodetocsv.helpers.api import VeracodeAPI
+from veracodetocsv.helpers.budget import TimeBudget
+from veracodetocsv.helpers.exceptions import VeracodeAPIError
+
+
+def test_timeouts():
+    veracode_api = VeracodeAPI(timeouts={"getbuildinfo": 5})
+
+    assert veracode_api._get_timeout("getbuildinfo") == 5
+    assert veracode_api._get_timeout("detailedreport") == 900
+
+
+def test_timeout_is_cut_to_time_budget():
+    veracode_api = VeracodeAPI(budget=TimeBudget(10))
+
+    assert veracode_api._get_timeout("detailedreport") <= 10
+
+
+def test_expired_time_budget():
+    veracode_api = VeracodeAPI(budget=TimeBudget(0))
+
+    with pytest.raises(VeracodeAPIError):
+        veracode_api._get_timeout("getapplist")
+
+
+def test_hedged_detailed_report():
+    veracode_api = VeracodeAPI(hedge_after=0.01)
+    attempts = []
+
+    def get_request(url, params=None, endpoint=None):
+        attempts.append(endpoint)
+        if len(attempts) == 1:
+            time.sleep(1)
+            return b"slow"
+        return b"fast"
+
+    veracode_api._get_request = get_request
+
+    assert veracode_api.get_detailed_report("1") == b"fast"
+    assert attempts == ["detailedreport", "detailedreport"]
+
+
+def test_hedged_detailed_report_failure():
+    veracode_api = VeracodeAPI(hedge_after=0.01)
+
+    def get_request(url, params=None, endpoint=None):
+        raise VeracodeAPIError("failed")
+
+    veracode_api._get_request = get_request
+
+    with pytest.raises(VeracodeAPIError):
+        veracode_api.get_detailed_report("1")
+
+
+class FakeResponse:
+    def __init__(self, status_code, chunks, delay=0):
+        self.status_code = status_code
+        self.chunks = chunks
+        self.delay = delay
+        self.headers = {}
+        self.request = self
+        self.url = "https://analysiscenter.veracode.com/api"
+        self.body = None
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+
+def test_get_request():
+    veracode_api = VeracodeAPI()
+    veracode_api.session = FakeSession(FakeResponse(200, [b"<a>", b"</a>"]))
+
+    assert veracode_api._get_request("https://analysiscenter.veracode.com/api", endpoint="getapplist") == b"<a></a>"
+
+
+def test_get_request_http_error():
+    veracode_api = VeracodeAPI()
+    veracode_api.session = FakeSession(FakeResponse(500, [b"error"]))
+
+    with pytest.raises(VeracodeAPIError):
+        veracode_api._get_request("https://analysiscenter.veracode.com/api", endpoint="getapplist")
+
+
+def test_get_request_deadline():
+    veracode_api = VeracodeAPI(timeouts={"detailedreport": 0.05})
+    veracode_api.session = FakeSession(FakeResponse(200, [b"<a>"] * 10, delay=0.01))
+
+    with pytest.raises(VeracodeAPIError):
+        veracode_api._get_request("https://analysiscenter.veracode.com/api", endpoint="detailedreport")
+
+
+def test_hedged_detailed_report_unexpected_error():
+    veracode_api = VeracodeAPI(hedge_after=0.01)
+
+    def get_request(url, params=None, endpoint=None):
+        raise ValueError("signing failed")
+
+    veracode_api._get_request = get_request
+
+    with pytest.raises(ValueError):
+        veracode_api.get_detailed_report("1")
+
+
+def test_hedged_detailed_report_deadline():
+    veracode_api = VeracodeAPI(timeouts={"detailedreport": 0.05}, hedge_after=0.01)
+
+    def get_request(url, params=None, endpoint=None):
+        time.sleep(1)
+        return b"slow"
+
+    veracode_api._get_request = get_request
+
+    with pytest.raises(VeracodeAPIError):
+        veracode_api.get_detailed_report("1")
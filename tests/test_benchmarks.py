@@ -0,0 +1,17 @@
+from __future__ import absolute_import
+
+import json
+
+from benchmarks import run
+
+
+def test_benchmarks_run(tmpdir):
+    output = str(tmpdir.join("bench_results.json"))
+    results = run.main(["--flaws", "20", "--builds", "10", "--repeat", "1", "--output", output])
+
+    with open(output) as f:
+        assert json.load(f) == results
+    assert set(results["results"]) == set(["parse_and_remove_xml_namespaces", "get_flaws", "get_flaws_flaw_table",
+                                           "get_builds", "to_list_rows", "row_extractor_rows", "create_csv"])
+    assert all(result["items"] > 0 for result in results["results"].values())
+    assert run.compare(results, results)[0].endswith("1.00x baseline time")
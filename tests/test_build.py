@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+
+import os
+import json
+
+from veracodetocsv.helpers.build import BuildTools, RUN_LOCK_FILE
+from veracodetocsv.helpers.lock import FileLock
+
+
+def test_expected_cost_uses_build_history(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    build_tools = BuildTools()
+    build_tools.update_and_save_processed_builds_file("1", "9", None, 5)
+    build_tools.update_and_save_processed_builds_file("1", "10", None, 50)
+
+    assert build_tools.get_expected_cost("1", "9") == 5
+    assert build_tools.get_expected_cost("1", "11") == 50
+    assert build_tools.get_expected_cost("2", "20") == 0
+
+
+def test_signals_are_saved_with_processed_builds(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    build_tools = BuildTools()
+    build_tools.update_signal("app:1:sd", "2017-01-01T00:00:00-05:00")
+    build_tools.save_processed_builds_file()
+
+    with open("processed_builds.txt") as f:
+        assert json.load(f) == {"_signals": {"app:1:sd": "2017-01-01T00:00:00-05:00"}}
+    build_tools = BuildTools()
+    assert build_tools.processed_builds == {}
+    assert build_tools.signal_is_unchanged("app:1:sd", "2017-01-01T00:00:00-05:00")
+
+
+def test_overlapping_runs_do_not_clobber_each_other(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    first_run = BuildTools()
+    second_run = BuildTools()
+    first_run.update_and_save_processed_builds_file("1", "10", None, 5)
+    second_run.update_and_save_processed_builds_file("2", "20", None, 7)
+
+    with open("processed_builds.txt") as f:
+        saved = json.load(f)
+    assert saved["1"]["10"]["flaw_count"] == 5
+    assert saved["2"]["20"]["flaw_count"] == 7
+    assert not os.path.exists("processed_builds.txt.tmp")
+
+
+def test_claims_are_exclusive(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    first_run = BuildTools()
+    second_run = BuildTools()
+
+    assert first_run.claim_builds([("1", "10", None), ("1", "11", None)]) == [("1", "10"), ("1", "11")]
+    assert second_run.claim_builds([("1", "10", None), ("1", "12", None)]) == [("1", "12")]
+
+    first_run.update_and_save_processed_builds_file("1", "10", None, 5)
+    first_run.release_claims()
+    assert second_run.claim_builds([("1", "10", None), ("1", "11", None)]) == [("1", "11")]
+
+
+def test_expired_claims_are_ignored(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    BuildTools(claim_lease_seconds=-1).claim_builds([("1", "10", None)])
+
+    assert BuildTools().claim_builds([("1", "10", None)]) == [("1", "10")]
+
+
+def test_run_lock(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    first_lock = FileLock(RUN_LOCK_FILE)
+    second_lock = FileLock(RUN_LOCK_FILE)
+
+    assert first_lock.acquire(blocking=False)
+    assert not second_lock.acquire(blocking=False)
+    first_lock.release()
+    assert second_lock.acquire(blocking=False)
+    second_lock.release()
+
+
+def test_cached_values_expire_with_change_marker(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    build_tools = BuildTools()
+    build_tools.cache_value("business_unit:1", "2017-01-01T00:00:00-05:00", "finance")
+
+    assert build_tools.get_cached_value("business_unit:1", "2017-01-01T00:00:00-05:00") == "finance"
+    assert build_tools.get_cached_value("business_unit:1", "2017-02-01T00:00:00-05:00") is None
+    assert build_tools.get_cached_value("business_unit:2", "2017-01-01T00:00:00-05:00") is None
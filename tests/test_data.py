@@ -0,0 +1,222 @@
+from __future__ import absolute_import
+
+import pytest
+
+from veracodetocsv.helpers.budget import TimeBudget
+from veracodetocsv.helpers.data import DataLoader
+from veracodetocsv.helpers.flawtable import FlawTable
+from veracodetocsv.helpers.projection import Projection
+from veracodetocsv.helpers.selection import Selector
+
+
+APP_LIST = b"""<?xml version="1.0" encoding="UTF-8"?>
+<applist xmlns="https://analysiscenter.veracode.com/schema/2.0/applist">
+<app app_id="1" app_name="test-app" policy_updated_date="2017-01-01T00:00:00-05:00"/>
+</applist>"""
+
+APP_INFO = b"""<?xml version="1.0" encoding="UTF-8"?>
+<appinfo xmlns="https://analysiscenter.veracode.com/schema/2.0/appinfo">
+<application app_id="1" app_name="test-app" business_unit="finance"/>
+</appinfo>"""
+
+SANDBOX_LIST = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sandboxlist xmlns="https://analysiscenter.veracode.com/schema/4.0/sandboxlist">
+<sandbox sandbox_id="5" sandbox_name="test-sandbox" last_modified="2017-01-01T00:00:00-05:00"/>
+</sandboxlist>"""
+
+BUILD_LIST = b"""<?xml version="1.0" encoding="UTF-8"?>
+<buildlist xmlns="https://analysiscenter.veracode.com/schema/2.0/buildlist">
+<build build_id="10" version="test-build" policy_updated_date="2017-01-01T00:00:00-05:00"/>
+</buildlist>"""
+
+BUILD_INFO = b"""<?xml version="1.0" encoding="UTF-8"?>
+<buildinfo xmlns="https://analysiscenter.veracode.com/schema/4.0/buildinfo">
+<build build_id="10"><analysis_unit published_date="2017-01-01T00:00:00-05:00"/></build>
+</buildinfo>"""
+
+DETAILED_REPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<detailedreport xmlns="https://www.veracode.com/schema/reports/export/1.0">
+<severity level="5"><category categoryname="Command Injection"><cwe cweid="78"><staticflaws>
+<flaw issueid="2" date_first_occurrence="2017-01-01 00:00:00 UTC" severity="5" cweid="78"
+ categoryname="Command Injection" affects_policy_compliance="true" remediationeffort="3" remediation_status="New"
+ mitigation_status_desc="Not Mitigated" exploitLevel="2" module="test.war" sourcefile="test.java" line="69"/>
+<flaw issueid="1" date_first_occurrence="2017-01-01 00:00:00 UTC" severity="5" cweid="78"
+ categoryname="Command Injection" affects_policy_compliance="true" remediationeffort="3" remediation_status="New"
+ mitigation_status_desc="Not Mitigated" exploitLevel="2" module="test.war" sourcefile="test.java" line="42"/>
+</staticflaws></cwe></category></severity>
+<static-analysis analysis_size_bytes="1024"/>
+</detailedreport>"""
+
+
+class FakeAPI:
+    def __init__(self):
+        self.calls = []
+
+    def get_app_list(self):
+        self.calls.append("getapplist")
+        return APP_LIST
+
+    def get_app_info(self, app_id):
+        self.calls.append("getappinfo")
+        return APP_INFO
+
+    def get_sandbox_list(self, app_id):
+        self.calls.append("getsandboxlist")
+        return SANDBOX_LIST
+
+    def get_build_list(self, app_id, sandbox_id=None):
+        self.calls.append("getbuildlist")
+        return BUILD_LIST
+
+    def get_build_info(self, app_id, build_id, sandbox_id=None):
+        self.calls.append("getbuildinfo")
+        return BUILD_INFO
+
+    def get_detailed_report(self, build_id):
+        self.calls.append("detailedreport")
+        return DETAILED_REPORT
+
+
+class FakeBuildTools:
+    def __init__(self, processed=False, signals=None):
+        self.processed = processed
+        self.signals = signals if signals is not None else {}
+
+    def build_should_be_processed(self, app_id, build_id, build_policy_updated_date):
+        return not self.processed
+
+    def get_expected_cost(self, app_id, build_id):
+        return 0
+
+    def signal_is_unchanged(self, key, signal):
+        return signal is not None and self.signals.get(key) == signal
+
+    def update_signal(self, key, signal):
+        self.signals[key] = signal
+
+    def get_cached_value(self, key, signal):
+        cached = self.signals.get(key)
+        return cached[1] if cached is not None and cached[0] == signal else None
+
+    def cache_value(self, key, signal, value):
+        self.signals[key] = [signal, value]
+
+
+def test_get_data():
+    api = FakeAPI()
+    apps = DataLoader(api, FakeBuildTools()).get_data(include_dynamic_builds=False)
+
+    assert api.calls == ["getapplist", "getbuildlist", "getappinfo", "getbuildinfo", "detailedreport"]
+    assert apps[0].business_unit == "finance"
+    assert apps[0].builds[0].analysis_size_bytes == "1024"
+    assert [flaw.id for flaw in apps[0].builds[0].flaws] == ["1", "2"]
+
+
+def test_plan_skips_app_info_when_nothing_new():
+    api = FakeAPI()
+    build_tools = FakeBuildTools(processed=True)
+    data_loader = DataLoader(api, build_tools)
+    data_loader.get_data(include_dynamic_builds=False)
+
+    assert api.calls == ["getapplist", "getbuildlist"]
+    assert [str(call) for call in data_loader.plan.avoided] == ["getappinfo app 1 (no builds to process)"]
+    assert build_tools.signals == {"app:1:s": "2017-01-01T00:00:00-05:00"}
+
+
+def test_plan_skips_build_list_when_app_unchanged():
+    api = FakeAPI()
+    data_loader = DataLoader(api, FakeBuildTools(signals={"app:1:s": "2017-01-01T00:00:00-05:00"}))
+    data_loader.plan_data(include_dynamic_builds=False)
+
+    assert api.calls == ["getapplist"]
+    assert [planned_call.call for planned_call in data_loader.plan.avoided] == ["getbuildlist", "getappinfo"]
+
+
+def test_get_data_reads_only_projected_fields():
+    data_loader = DataLoader(FakeAPI(), FakeBuildTools(), Projection(["flaw_id", "flaw_line"]))
+    flaw = data_loader.get_data(include_dynamic_builds=False)[0].builds[0].flaws[0]
+
+    assert flaw.to_list() == ["1", None, None, None, None, None, None, None, None, None, None, None, "42"]
+
+
+def test_get_data_shares_repeated_values():
+    data_loader = DataLoader(FakeAPI(), FakeBuildTools())
+    flaws = data_loader.get_data(include_dynamic_builds=False)[0].builds[0].flaws
+
+    assert flaws[0].categoryname is flaws[1].categoryname
+    assert flaws[0].date_first_occurrence is flaws[1].date_first_occurrence
+    assert len(data_loader.memory_report()) == 2
+
+
+def test_get_data_uses_flaw_table_for_large_reports():
+    data_loader = DataLoader(FakeAPI(), FakeBuildTools(), flaw_table_threshold=2)
+    flaws = data_loader.get_data(include_dynamic_builds=False)[0].builds[0].flaws
+
+    assert isinstance(flaws, FlawTable)
+    assert [row[0] for row in flaws.rows(["id"])] == [1, 2]
+
+
+def test_plan_skips_business_unit_lookup_when_app_unchanged():
+    api = FakeAPI()
+    data_loader = DataLoader(api, FakeBuildTools(signals={"app:1:s": "2017-01-01T00:00:00-05:00"}))
+    apps = data_loader.plan_data(include_dynamic_builds=False, selector=Selector(business_units=["finance"]))
+
+    assert api.calls == ["getapplist"]
+    assert apps[0].builds == []
+
+
+def test_plan_filters_changed_apps_by_business_unit():
+    api = FakeAPI()
+    data_loader = DataLoader(api, FakeBuildTools())
+
+    assert data_loader.plan_data(include_dynamic_builds=False, selector=Selector(business_units=["retail"])) == []
+    assert api.calls == ["getapplist", "getappinfo"]
+
+
+def test_get_data_skips_calls_for_unexported_columns():
+    api = FakeAPI()
+    data_loader = DataLoader(api, FakeBuildTools(), Projection(["app_name", "build_id", "flaw_id"]))
+    build = data_loader.get_data(include_dynamic_builds=False)[0].builds[0]
+
+    assert api.calls == ["getapplist", "getbuildlist", "detailedreport"]
+    assert build.published_date is None
+    assert [str(call) for call in data_loader.plan.avoided] == ["getappinfo app 1 (column not exported)",
+                                                               "getbuildinfo app 1 build 10 (column not exported)"]
+
+
+def test_fetch_data_leaves_builds_when_budget_used_up():
+    data_loader = DataLoader(FakeAPI(), FakeBuildTools(), budget=TimeBudget(0))
+    apps = data_loader.plan_data(include_dynamic_builds=False)
+
+    assert data_loader.fetch_data(apps)[0].builds == []
+
+
+def test_fetch_data_raises_malformed_report_errors():
+    api = FakeAPI()
+    api.get_detailed_report = lambda build_id: DETAILED_REPORT.replace(b'issueid="1"', b"")
+    data_loader = DataLoader(api, FakeBuildTools())
+
+    with pytest.raises(KeyError):
+        data_loader.get_data(include_dynamic_builds=False)
+
+
+def test_plan_does_not_look_up_excluded_apps_again():
+    api = FakeAPI()
+    build_tools = FakeBuildTools()
+    for _ in range(3):
+        assert DataLoader(api, build_tools).plan_data(include_dynamic_builds=False,
+                                                      selector=Selector(business_units=["retail"])) == []
+
+    assert api.calls == ["getapplist", "getappinfo", "getapplist", "getapplist"]
+    assert build_tools.signals == {"business_unit:1": ["2017-01-01T00:00:00-05:00", "finance"]}
+
+
+def test_plan_records_sandbox_list_when_app_unchanged():
+    api = FakeAPI()
+    data_loader = DataLoader(api, FakeBuildTools(signals={"app:1:s": "2017-01-01T00:00:00-05:00",
+                                                          "sandbox:5:s": "2017-01-01T00:00:00-05:00"}))
+    data_loader.plan_data(include_dynamic_builds=False, include_sandboxes=True)
+
+    assert api.calls == ["getapplist", "getsandboxlist"]
+    assert [str(call) for call in data_loader.plan.made] == ["getapplist account", "getsandboxlist app 1"]
+    assert [planned_call.call for planned_call in data_loader.plan.avoided] == ["getbuildlist", "getbuildlist", "getappinfo"]
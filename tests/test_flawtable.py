@@ -0,0 +1,59 @@
+from __future__ import absolute_import
+
+from datetime import datetime
+
+import pytz
+
+from veracodetocsv.helpers import models
+from veracodetocsv.helpers.flawtable import FlawTable
+
+
+def parse_date(date_string):
+    return pytz.utc.localize(datetime.strptime(date_string, "%Y-%m-%d %H:%M:%S"))
+
+
+def make_attrib(issueid, severity, sourcefile):
+    return {"issueid": issueid, "date_first_occurrence": "2017-01-01 00:00:00", "severity": severity, "cweid": "78",
+            "categoryname": "Command Injection", "affects_policy_compliance": "true", "remediationeffort": "3",
+            "remediation_status": "New", "mitigation_status_desc": "Not Mitigated", "exploitLevel": "2",
+            "module": "test.war", "sourcefile": sourcefile, "line": "69"}
+
+
+def make_table(fields=None):
+    flaw_table = FlawTable(fields if fields is not None else models.StaticFlaw.to_headers(), parse_date)
+    flaw_table.append(make_attrib("3", "5", "c.java"))
+    flaw_table.append(make_attrib("1", "2", "a.java"))
+    flaw_table.append(make_attrib("2", "4", "b.java"))
+    return flaw_table
+
+
+def test_rows_match_flaw_models():
+    flaw_table = make_table().sorted_by_id()
+    flaw = models.StaticFlaw("1", parse_date("2017-01-01 00:00:00"), "2", "78", "Command Injection", "true", "3",
+                             "New", "Not Mitigated", "2", "test.war", "a.java", "69")
+
+    assert len(flaw_table) == 3
+    rows = list(flaw_table.rows(models.StaticFlaw.to_headers()))
+    assert [str(value) for value in rows[0]] == [str(value) for value in flaw.to_list()]
+
+
+def test_sorted_by_id():
+    flaw_table = make_table(["sourcefile"]).sorted_by_id()
+
+    assert list(flaw_table.rows(["sourcefile"])) == [("a.java",), ("b.java",), ("c.java",)]
+    assert list(flaw_table.rows([])) == [(), (), ()]
+
+
+def test_filter_severity():
+    flaw_table = make_table().sorted_by_id().filter_severity(4)
+
+    assert len(flaw_table) == 2
+    assert list(flaw_table.rows(["id", "severity"])) == [(2, 4), (3, 5)]
+
+
+def test_shared_values():
+    flaw_table = make_table()
+
+    assert len(flaw_table.columns["categoryname"].values) == 1
+    assert len(flaw_table.columns["date_first_occurrence"].datetimes) == 1
+    assert flaw_table.nbytes() > 0
@@ -0,0 +1,11 @@
+from __future__ import absolute_import
+
+from veracodetocsv.helpers import log
+
+
+def test_truncate_payload():
+    assert log.truncate_payload(None) is None
+    assert log.truncate_payload(b"short") == b"short"
+    truncated = log.truncate_payload(b"x" * (log.DEBUG_PAYLOAD_BYTES + 10))
+    assert truncated.endswith("... (10 more bytes)")
+    assert len(truncated) < log.DEBUG_PAYLOAD_BYTES + 100
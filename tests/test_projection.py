@@ -0,0 +1,40 @@
+from __future__ import absolute_import
+
+import pytest
+
+from veracodetocsv.helpers import models
+from veracodetocsv.helpers.exceptions import VeracodeError
+from veracodetocsv.helpers.projection import Projection
+
+
+def make_static_flaw():
+    return models.StaticFlaw("1", "2017-01-01T00:00:00", "5", "78", "Command Injection",
+                             "true", "3", "New", "Not Mitigated", "2", "test.war", "test.java", "69")
+
+
+def test_all_columns():
+    projection = Projection()
+    app = models.App("1", "test-app", "finance")
+    build = models.StaticBuild("2", "test-build", "2017-01-01T00:00:00", flaws=[make_static_flaw()])
+    sandbox = models.Sandbox("3", "test-sandbox")
+
+    assert projection.flaw_fields("dynamic") == models.DynamicFlaw.to_headers()
+    assert len(projection.headers("static", True)) == 3 + 6 + 13 + 2
+    assert list(projection.row_extractor("static", True).rows(app, build, sandbox)) == \
+        [tuple(app.to_list() + build.to_list() + build.flaws[0].to_list() + sandbox.to_list())]
+
+
+def test_selected_columns():
+    projection = Projection(["app_name", "flaw_severity", "flaw_id", "sandbox_name"])
+    app = models.App("1", "test-app", "finance")
+    build = models.StaticBuild("2", "test-build", "2017-01-01T00:00:00", flaws=[make_static_flaw()])
+
+    assert projection.flaw_fields("static") == ["id", "severity"]
+    assert projection.headers("static") == ["app_name", "flaw_id", "flaw_severity"]
+    assert projection.headers("static", True) == ["app_name", "flaw_id", "flaw_severity", "sandbox_name"]
+    assert list(projection.row_extractor("static").rows(app, build)) == [("test-app", "1", "5")]
+
+
+def test_unknown_column():
+    with pytest.raises(VeracodeError):
+        Projection(["app_name", "flaw_colour"])
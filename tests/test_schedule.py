@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+import pytest
+
+from veracodetocsv.helpers.budget import TimeBudget
+from veracodetocsv.helpers.exceptions import VeracodeError
+from veracodetocsv.helpers.schedule import FetchJob, FetchScheduler
+
+
+def test_largest_jobs_run_first():
+    jobs = [FetchJob(None, "small", expected_cost=1), FetchJob(None, "large", expected_cost=100),
+            FetchJob(None, "unknown"), FetchJob(None, "medium", expected_cost=10)]
+    fetched = []
+
+    FetchScheduler().run(jobs, lambda job: fetched.append(job.build))
+
+    assert fetched == ["large", "medium", "small", "unknown"]
+
+
+def test_all_jobs_run_on_worker_pool():
+    jobs = [FetchJob(None, str(i), expected_cost=i) for i in range(20)]
+    fetched = []
+
+    FetchScheduler(workers=4).run(jobs, lambda job: fetched.append(job.build))
+
+    assert sorted(fetched, key=int) == [str(i) for i in range(20)]
+
+
+def test_fetch_error_is_raised():
+    def fetch(job):
+        raise VeracodeError("failed")
+
+    with pytest.raises(VeracodeError):
+        FetchScheduler(workers=2).run([FetchJob(None, "1"), FetchJob(None, "2")], fetch)
+
+
+def test_expired_budget_leaves_jobs():
+    fetched = []
+
+    FetchScheduler(budget=TimeBudget(0)).run([FetchJob(None, "1"), FetchJob(None, "2")], lambda job: fetched.append(job.build))
+
+    assert fetched == []
+
+
+def test_unexpected_fetch_error_is_raised():
+    fetched = []
+
+    def fetch(job):
+        if job.build == "malformed":
+            raise KeyError("issueid")
+        fetched.append(job.build)
+
+    with pytest.raises(KeyError):
+        FetchScheduler().run([FetchJob(None, "1"), FetchJob(None, "malformed", expected_cost=10)], fetch)
+    assert fetched == []
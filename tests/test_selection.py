@@ -0,0 +1,59 @@
+from __future__ import absolute_import
+
+import pytest
+
+from veracodetocsv.helpers import models
+from veracodetocsv.helpers.exceptions import VeracodeError
+from veracodetocsv.helpers.selection import PatternMatcher, Selector
+
+
+def test_pattern_matcher():
+    matcher = PatternMatcher(["test-app", "glob:web-*", r"re:api-\d+", ""])
+
+    assert len(matcher) == 3
+    assert matcher.matches("test-app")
+    assert matcher.matches("web-frontend")
+    assert matcher.matches("api-12")
+    assert not matcher.matches("api-12x")
+    assert not matcher.matches("test-app-2")
+    assert not matcher.matches(None)
+
+
+def test_pattern_matcher_invalid_regex():
+    with pytest.raises(VeracodeError):
+        PatternMatcher(["re:("])
+
+
+def test_selector_apps():
+    selector = Selector(app_include_list=["glob:web-*"], app_exclude_list=["web-legacy"])
+
+    assert selector.app_selected(models.App("1", "web-frontend"))
+    assert not selector.app_selected(models.App("2", "web-legacy"))
+    assert not selector.app_selected(models.App("3", "api"))
+    assert not selector.needs_business_unit()
+
+
+def test_selector_app_ids_and_business_units():
+    selector = Selector(app_ids=[1], business_units=["glob:Fin*"])
+
+    assert selector.app_selected(models.App("1", "test-app"))
+    assert not selector.app_selected(models.App("2", "test-app"))
+    assert selector.needs_business_unit()
+    assert selector.business_unit_selected("Finance")
+    assert not selector.business_unit_selected("Retail")
+
+
+def test_selector_sandboxes():
+    selector = Selector(sandbox_exclude_list=["re:tmp-.*"])
+
+    assert selector.sandbox_selected(models.Sandbox("1", "release"))
+    assert not selector.sandbox_selected(models.Sandbox("2", "tmp-branch"))
+
+
+def test_pattern_matcher_inline_flags():
+    matcher = PatternMatcher(["re:(?i)payments-.*", r"re:api-\d+"])
+
+    assert matcher.matches("Payments-EU")
+    assert matcher.matches("api-12")
+    assert not matcher.matches("API-12")
+    assert PatternMatcher(["re:a|ab"]).matches("ab")
@@ -0,0 +1,27 @@
+from __future__ import absolute_import
+
+from veracodetocsv.helpers.values import ValueTable
+
+
+def test_value_table_shares_equal_values():
+    value_table = ValueTable("test")
+    first = value_table.share("".join(["Command ", "Injection"]))
+    second = value_table.share("".join(["Command ", "Injection"]))
+
+    assert first is second
+    assert len(value_table) == 1
+    assert value_table.lookups == 2
+    assert value_table.bytes_saved > 0
+
+
+def test_value_table_converts_each_key_once():
+    conversions = []
+
+    def convert(key):
+        conversions.append(key)
+        return int(key)
+
+    value_table = ValueTable("test")
+
+    assert [value_table.share(key, convert) for key in ["1", "2", "1", "1"]] == [1, 2, 1, 1]
+    assert conversions == ["1", "2"]
@@ -0,0 +1,98 @@
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import logging
+
+import pytest
+
+from veracodetocsv import veracodetocsv
+from veracodetocsv.helpers.build import PROCESSED_BUILDS_FILE, CLAIMS_FILE
+from tests.test_data import FakeAPI
+
+
+class MalformedReportAPI(FakeAPI):
+    def get_detailed_report(self, build_id):
+        self.calls.append("detailedreport")
+        return b"<detailedreport"
+
+
+@pytest.fixture
+def run_main(tmp_path, monkeypatch):
+    """Runs main() against a fake API with the given config and arguments"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(logging.getLogger(), "handlers", [])
+
+    def run(config=u"", args=(), api_class=FakeAPI):
+        config_path = tmp_path / "config.py"
+        config_path.write_text(u"include_dynamic_flaws = False\ninclude_sandboxes = False\n" + config)
+        monkeypatch.setattr("sys.argv", ["veracodetocsv", "-c", str(config_path)] + list(args))
+        monkeypatch.setattr(veracodetocsv.api, "VeracodeAPI", lambda **kwargs: api_class())
+        veracodetocsv.main()
+
+    return run
+
+
+@pytest.fixture
+def watch(run_main, monkeypatch):
+    """Runs main() in watch mode for a number of cycles, returning the processed build state seen after each cycle"""
+    def run(api_class, cycles):
+        states = []
+
+        def sleep(delay):
+            with open(PROCESSED_BUILDS_FILE) as f:
+                states.append(json.load(f))
+            if len(states) == cycles:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr(veracodetocsv.time, "sleep", sleep)
+        with pytest.raises(KeyboardInterrupt):
+            run_main(args=["--watch", "1"], api_class=api_class)
+        return states
+
+    return run
+
+
+def test_watch_saves_state_after_each_cycle(watch):
+    states = watch(FakeAPI, 2)
+
+    assert list(states[0]["1"]) == ["10"]
+    assert states[0]["_signals"] == {}
+    assert states[1]["_signals"] == {"app:1:s": "2017-01-01T00:00:00-05:00"}
+    assert len(os.listdir(os.path.join("output", "static"))) == 1
+
+
+def test_watch_continues_after_malformed_response(watch):
+    with open(PROCESSED_BUILDS_FILE, "w") as f:
+        f.write("{}")
+
+    states = watch(MalformedReportAPI, 2)
+
+    assert states == [{}, {}]
+
+
+def test_exit_run_skips_builds_claimed_by_share_run(run_main):
+    with open(CLAIMS_FILE, "w") as f:
+        json.dump({"1:10": {"owner": "share-run", "expires": time.time() + 60}}, f)
+
+    run_main()
+
+    assert os.listdir(os.path.join("output", "static")) == []
+    with open(CLAIMS_FILE) as f:
+        assert list(json.load(f)) == ["1:10"]
+
+
+def test_unknown_concurrent_runs_value_is_rejected(run_main):
+    with pytest.raises(SystemExit) as e:
+        run_main(u'concurrent_runs = "exti"\n')
+
+    assert e.value.code == 2
+
+
+def test_run_writes_headers_and_flaw_rows(run_main):
+    run_main(u'columns = ["app_name", "build_id", "flaw_id"]\n')
+
+    output_directory = os.path.join("output", "static")
+    with open(os.path.join(output_directory, os.listdir(output_directory)[0])) as f:
+        assert f.read().splitlines() == ['"app_name","build_id","flaw_id"', '"test-app","10","1"', '"test-app","10","2"']
@@ -13,49 +13,150 @@ try:
 except ImportError:
     from urlparse import urlparse
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import time
 import requests
 import logging
+import threading
 from requests.adapters import HTTPAdapter
 from veracode_api_signing.exceptions import VeracodeAPISigningException
 from veracode_api_signing.plugin_requests import RequestsAuthPluginVeracodeHMAC
 from .exceptions import VeracodeAPIError
+from .log import truncate_payload
+
+
+# Seconds allowed for each call from sending the request to receiving the whole response
+DEFAULT_TIMEOUTS = {
+    "getapplist": 120,
+    "getappinfo": 60,
+    "getsandboxlist": 60,
+    "getbuildlist": 60,
+    "getbuildinfo": 60,
+    "detailedreport": 900
+}
+CONNECT_TIMEOUT = 30
 
 
 class VeracodeAPI:
-    def __init__(self, proxies=None):
+    def __init__(self, proxies=None, timeouts=None, hedge_after=None, budget=None):
         self.baseurl = "https://analysiscenter.veracode.com/api"
-        requests.Session().mount(self.baseurl, HTTPAdapter(max_retries=3))
+        # One session for the life of the process so connections are reused between requests and watch cycles
+        self.session = requests.Session()
+        self.session.mount(self.baseurl, HTTPAdapter(max_retries=3))
+        self.session.auth = RequestsAuthPluginVeracodeHMAC()
         self.proxies = proxies
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        # Seconds after which a second detailed report request is started alongside a slow one, None to disable
+        self.hedge_after = hedge_after
+        self.budget = budget
+
+    @staticmethod
+    def _log_exchange(message, r, content):
+        # Only build the message when debug logging is on, and keep large bodies out of the log
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("{}:\r\n{}\r\n{}\r\n{}\r\n\r\n{}\r\n{}\r\n{}\r\n"
+                          .format(message, r.request.url, r.request.headers, truncate_payload(r.request.body),
+                                  r.status_code, r.headers, truncate_payload(content)))
+
+    def _get_timeout(self, endpoint):
+        """Returns the seconds allowed for a call, cut short if the run's time budget ends sooner"""
+        timeout = self.timeouts[endpoint]
+        if self.budget is not None and self.budget.remaining() is not None:
+            if self.budget.expired():
+                raise VeracodeAPIError("Time budget used up before calling {}".format(endpoint))
+            timeout = min(timeout, self.budget.remaining())
+        return timeout
 
-    def _get_request(self, url, params=None):
+    def _get_request(self, url, params=None, endpoint=None):
+        timeout = self._get_timeout(endpoint) if endpoint is not None else None
+        deadline = time.time() + timeout if timeout is not None else None
         try:
-            r = requests.get(url, params=params, auth=RequestsAuthPluginVeracodeHMAC(), proxies=self.proxies)
+            r = self.session.get(url, params=params, proxies=self.proxies, stream=True,
+                                 timeout=(CONNECT_TIMEOUT, timeout) if timeout is not None else None)
+            # The read timeout only covers gaps between bytes, so the whole download is also held to the deadline
+            chunks = []
+            for chunk in r.iter_content(65536):
+                chunks.append(chunk)
+                if deadline is not None and time.time() > deadline:
+                    r.close()
+                    logging.error("Deadline of {:.0f}s exceeded for {}".format(timeout, r.request.url))
+                    raise VeracodeAPIError("Deadline exceeded for {}".format(endpoint))
+            content = b"".join(chunks)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("GET {} {} {} bytes in {:.2f}s".format(r.request.url, r.status_code, len(content),
+                                                                     r.elapsed.total_seconds()))
             if 200 <= r.status_code <= 299:
-                if r.content is None:
-                    logging.debug("HTTP response body empty:\r\n{}\r\n{}\r\n{}\r\n\r\n{}\r\n{}\r\n{}\r\n"
-                                  .format(r.request.url, r.request.headers, r.request.body, r.status_code, r.headers, r.content))
+                if not content:
+                    self._log_exchange("HTTP response body empty", r, content)
                     raise VeracodeAPIError("HTTP response body is empty")
                 else:
-                    return r.content
+                    return content
             else:
-                logging.debug("HTTP error for request:\r\n{}\r\n{}\r\n{}\r\n\r\n{}\r\n{}\r\n{}\r\n"
-                              .format(r.request.url, r.request.headers, r.request.body, r.status_code, r.headers, r.content))
+                self._log_exchange("HTTP error for request", r, content)
                 raise VeracodeAPIError("HTTP error: {}".format(r.status_code))
         except requests.exceptions.RequestException as e:
             logging.exception("Connection error")
             raise VeracodeAPIError(e)
 
+    def _get_hedged_request(self, url, params, endpoint):
+        """Makes a request, starting a second identical one if the first is slow, and returns whichever succeeds first"""
+        results = queue.Queue()
+        timeout = self._get_timeout(endpoint)
+
+        def attempt():
+            try:
+                results.put((True, self._get_request(url, params, endpoint)))
+            except Exception as e:
+                # Anything not put on the queue, such as a request signing error, would leave the caller waiting
+                results.put((False, e))
+
+        def start_attempt():
+            # Daemon threads so that a losing attempt never keeps the process alive
+            thread = threading.Thread(target=attempt)
+            thread.daemon = True
+            thread.start()
+            return time.time() + timeout
+
+        def get_result():
+            try:
+                return results.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                logging.error("Deadline of {:.0f}s exceeded for hedged {} request".format(timeout, endpoint))
+                raise VeracodeAPIError("Deadline exceeded for {}".format(endpoint))
+
+        attempts = 1
+        deadline = start_attempt()
+        try:
+            succeeded, result = results.get(timeout=min(self.hedge_after, timeout))
+        except queue.Empty:
+            logging.log(logging.INFO, "Hedging slow {} request".format(endpoint))
+            attempts += 1
+            deadline = start_attempt()
+            succeeded, result = get_result()
+        attempts -= 1
+        while not succeeded and attempts > 0:
+            succeeded, result = get_result()
+            attempts -= 1
+        if not succeeded:
+            raise result
+        return result
+
     def get_app_list(self):
         """Returns all application profiles."""
-        return self._get_request(self.baseurl + "/4.0/getapplist.do")
+        return self._get_request(self.baseurl + "/4.0/getapplist.do", endpoint="getapplist")
 
     def get_app_info(self, app_id):
         """Returns application profile info for a given app ID."""
-        return self._get_request(self.baseurl + "/5.0/getappinfo.do", params={"app_id": app_id})
+        return self._get_request(self.baseurl + "/5.0/getappinfo.do", params={"app_id": app_id}, endpoint="getappinfo")
 
     def get_sandbox_list(self, app_id):
         """Returns a list of sandboxes for a given app ID"""
-        return self._get_request(self.baseurl + "/5.0/getsandboxlist.do", params={"app_id": app_id})
+        return self._get_request(self.baseurl + "/5.0/getsandboxlist.do", params={"app_id": app_id}, endpoint="getsandboxlist")
 
     def get_build_list(self, app_id, sandbox_id=None):
         """Returns all builds for a given app ID."""
@@ -63,7 +164,7 @@ class VeracodeAPI:
             params = {"app_id": app_id}
         else:
             params = {"app_id": app_id, "sandbox_id": sandbox_id}
-        return self._get_request(self.baseurl + "/4.0/getbuildlist.do", params=params)
+        return self._get_request(self.baseurl + "/4.0/getbuildlist.do", params=params, endpoint="getbuildlist")
     
     def get_build_info(self, app_id, build_id, sandbox_id=None):
         """Returns build info for a given build ID."""
@@ -71,8 +172,11 @@ class VeracodeAPI:
             params = {"app_id": app_id, "build_id": build_id}
         else:
             params = {"app_id": app_id, "build_id": build_id, "sandbox_id": sandbox_id}
-        return self._get_request(self.baseurl + "/5.0/getbuildinfo.do", params=params)
+        return self._get_request(self.baseurl + "/5.0/getbuildinfo.do", params=params, endpoint="getbuildinfo")
 
     def get_detailed_report(self, build_id):
         """Returns a detailed report for a given build ID."""
-        return self._get_request(self.baseurl + "/3.0/detailedreport.do", params={"build_id": build_id})
+        url = self.baseurl + "/3.0/detailedreport.do"
+        if self.hedge_after is not None:
+            return self._get_hedged_request(url, {"build_id": build_id}, "detailedreport")
+        return self._get_request(url, params={"build_id": build_id}, endpoint="detailedreport")
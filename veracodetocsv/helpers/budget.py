@@ -0,0 +1,21 @@
+# Purpose:  Time budget utilities
+
+import time
+
+
+class TimeBudget:
+    """Tracks how much of a run's time budget is left. A budget of None never runs out."""
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.restart()
+
+    def restart(self):
+        self.started = time.time()
+
+    def remaining(self):
+        if self.seconds is None:
+            return None
+        return max(0.0, self.seconds - (time.time() - self.started))
+
+    def expired(self):
+        return self.seconds is not None and self.remaining() <= 0
@@ -1,29 +1,82 @@
 # Purpose:  Build utilities
 
+import os
 import json
+import time
+import uuid
 import errno
 import logging
 import pytz
 from dateutil import parser
 
+from veracodetocsv.helpers.lock import FileLock
 from veracodetocsv.helpers.exceptions import VeracodeError
 
 
+PROCESSED_BUILDS_FILE = "processed_builds.txt"
+CLAIMS_FILE = "processed_builds.claims.txt"
+# Held for the length of a read-merge-write of the files above
+STATE_LOCK_FILE = "processed_builds.lock"
+# Held for the whole run by an instance that does not share work with other instances
+RUN_LOCK_FILE = "processed_builds.run.lock"
+SIGNALS_KEY = "_signals"
+
+
+def _read_json_file(path):
+    try:
+        with open(path, "r") as f:
+            return json.loads(f.read())
+    except IOError as e:
+        if e.errno is errno.ENOENT:
+            return {}
+        logging.exception("Error opening {}".format(path))
+        raise VeracodeError(e)
+
+
+def _write_json_file(path, data):
+    """Writes to a temporary file and renames it over the old one, so readers never see a partial file"""
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        if hasattr(os, "replace"):
+            os.replace(temp_path, path)
+        else:
+            if os.path.exists(path) and os.name == "nt":
+                os.remove(path)
+            os.rename(temp_path, path)
+    except (IOError, OSError) as e:
+        logging.exception("Error saving {}".format(path))
+        raise VeracodeError(e)
+
+
 class BuildTools:
-    def __init__(self):
-        self.processed_builds = self._get_processed_builds()
+    def __init__(self, claim_lease_seconds=7200):
+        self.owner = uuid.uuid4().hex
+        self.claim_lease_seconds = claim_lease_seconds
+        self.state_lock = FileLock(STATE_LOCK_FILE)
+        # Builds and signals changed by this run since the last save
+        self.updated_builds = set()
+        self.updated_signals = set()
+        with self.state_lock:
+            self.processed_builds = self._get_processed_builds()
+        # Last seen change markers for apps and sandboxes whose builds were all processed, kept alongside the builds
+        self.signals = self.processed_builds.pop(SIGNALS_KEY, {})
 
     def _get_processed_builds(self):
-        try:
-            with open("processed_builds.txt", "r") as f:
-                processed_builds = json.loads(f.read())
-        except IOError as e:
-            if e.errno is errno.ENOENT:
-                processed_builds = {}
-            else:
-                logging.exception("Error opening processed builds file")
-                raise VeracodeError(e)
-        return processed_builds
+        return _read_json_file(PROCESSED_BUILDS_FILE)
+
+    def _merge_saved_state(self):
+        """Reloads the saved state, keeping this run's unsaved updates on top of any saved by other runs.
+        Must be called with the state lock held."""
+        processed_builds = self._get_processed_builds()
+        signals = processed_builds.pop(SIGNALS_KEY, {})
+        for app_id, build_id in self.updated_builds:
+            processed_builds.setdefault(app_id, {})[build_id] = self.processed_builds[app_id][build_id]
+        for key in self.updated_signals:
+            signals[key] = self.signals[key]
+        self.processed_builds = processed_builds
+        self.signals = signals
 
     def build_should_be_processed(self, app_id, build_id, build_policy_updated_date):
         if app_id not in self.processed_builds or build_id not in self.processed_builds[app_id]:
@@ -41,16 +94,82 @@ class BuildTools:
             else:
                 return build_policy_updated_date.astimezone(pytz.utc) > last_build_policy_updated_date
 
-    def update_and_save_processed_builds_file(self, app_id, build_id, build_policy_updated_date):
+    def signal_is_unchanged(self, key, signal):
+        """Returns True if the change marker for an app or sandbox matches the one recorded when it was last caught up"""
+        return signal is not None and self.signals.get(key) == signal
+
+    def update_signal(self, key, signal):
+        """Records the change marker for an app or sandbox that has no builds left to process"""
+        if signal is not None:
+            self.signals[key] = signal
+            self.updated_signals.add(key)
+
+    def get_cached_value(self, key, signal):
+        """Returns a value recorded with cache_value, or None if the change marker has moved since"""
+        cached = self.signals.get(key)
+        if signal is None or not isinstance(cached, list) or cached[0] != signal:
+            return None
+        return cached[1]
+
+    def cache_value(self, key, signal, value):
+        """Records a looked up value, such as an app's business unit, until the change marker moves"""
+        if signal is not None:
+            self.signals[key] = [signal, value]
+            self.updated_signals.add(key)
+
+    def get_expected_cost(self, app_id, build_id):
+        """Returns the flaw count recorded for a build, or for the app's latest processed build if the build is new"""
+        app_builds = self.processed_builds.get(app_id)
+        if not app_builds:
+            return 0
+        build_data = app_builds.get(build_id)
+        if build_data is None:
+            build_data = app_builds[max(app_builds, key=int)]
+        return build_data.get("flaw_count") or 0
+
+    def update_and_save_processed_builds_file(self, app_id, build_id, build_policy_updated_date, flaw_count=None):
         build_policy_updated_date_string = str(build_policy_updated_date) if build_policy_updated_date is not None else None
-        build_data = {"policy_updated_date": build_policy_updated_date_string}
+        build_data = {"policy_updated_date": build_policy_updated_date_string, "flaw_count": flaw_count}
         if app_id not in self.processed_builds:
             self.processed_builds[app_id] = {build_id: build_data}
         else:
             self.processed_builds[app_id][build_id] = build_data
-        try:
-            with open("processed_builds.txt", "w") as f:
-                json.dump(self.processed_builds, f)
-        except IOError as e:
-            logging.exception("Error saving processed builds file")
-            raise VeracodeError(e)
+        self.updated_builds.add((app_id, build_id))
+        self.save_processed_builds_file()
+
+    def save_processed_builds_file(self):
+        """Merges this run's updates into the saved state and writes it back in one transaction"""
+        with self.state_lock:
+            self._merge_saved_state()
+            state = dict(self.processed_builds)
+            state[SIGNALS_KEY] = self.signals
+            _write_json_file(PROCESSED_BUILDS_FILE, state)
+        self.updated_builds.clear()
+        self.updated_signals.clear()
+
+    def claim_builds(self, builds):
+        """Takes a lease on each (app_id, build_id, policy_updated_date) build for this run. Returns the builds that no
+        other run holds and that no other run has processed since this one planned."""
+        now = time.time()
+        claimed = []
+        with self.state_lock:
+            self._merge_saved_state()
+            claims = dict((key, claim) for key, claim in _read_json_file(CLAIMS_FILE).items() if claim["expires"] > now)
+            for app_id, build_id, build_policy_updated_date in builds:
+                key = "{}:{}".format(app_id, build_id)
+                if key in claims and claims[key]["owner"] != self.owner:
+                    continue
+                if not self.build_should_be_processed(app_id, build_id, build_policy_updated_date):
+                    continue
+                claims[key] = {"owner": self.owner, "expires": now + self.claim_lease_seconds}
+                claimed.append((app_id, build_id))
+            _write_json_file(CLAIMS_FILE, claims)
+        return claimed
+
+    def release_claims(self):
+        """Gives up every lease held by this run"""
+        with self.state_lock:
+            claims = _read_json_file(CLAIMS_FILE)
+            if any(claim["owner"] == self.owner for claim in claims.values()):
+                _write_json_file(CLAIMS_FILE, dict((key, claim) for key, claim in claims.items()
+                                                   if claim["owner"] != self.owner))
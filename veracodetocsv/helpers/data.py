@@ -2,6 +2,8 @@
 from __future__ import print_function
 
 import sys
+import logging
+from operator import itemgetter
 import xml.etree.ElementTree as ETree
 try:
     from StringIO import StringIO
@@ -11,6 +13,12 @@ import pytz
 from dateutil import parser
 
 from veracodetocsv.helpers import models
+from veracodetocsv.helpers.plan import RequestPlan
+from veracodetocsv.helpers.flawtable import FlawTable
+from veracodetocsv.helpers.projection import Projection
+from veracodetocsv.helpers.schedule import FetchJob, FetchScheduler
+from veracodetocsv.helpers.selection import Selector
+from veracodetocsv.helpers.values import ValueTable
 from veracodetocsv.helpers.exceptions import VeracodeError, VeracodeAPIError
 
 
@@ -25,10 +33,54 @@ def parse_and_remove_xml_namespaces(xml_string):
     return it.root
 
 
+# Flaw attributes that repeat across many flaws of a report, such as category, module or status
+SHARED_FLAW_FIELDS = frozenset(["severity", "cweid", "categoryname", "affects_policy_compliance", "remediationeffort",
+                                "remediation_status", "mitigation_status_desc", "exploitLevel", "module", "sourcefile"])
+
+
+def _parse_date(date_string):
+    return parser.parse(date_string).astimezone(pytz.utc)
+
+
+def _skip_field(attrib):
+    return None
+
+
+def _shared_getter(name, value_table):
+    return lambda attrib: value_table.share(attrib[name])
+
+
+def compile_flaw_reader(flaw_model, fields, shared_strings=None, shared_dates=None):
+    """Returns a function that builds a flaw from a flaw element's attributes, reading only the given fields.
+    Repeated values are taken from the value tables when given."""
+    getters = []
+    for header in flaw_model.to_headers():
+        if header not in fields:
+            getters.append(_skip_field)
+        elif header == "date_first_occurrence":
+            if shared_dates is None:
+                getters.append(lambda attrib: _parse_date(attrib["date_first_occurrence"]))
+            else:
+                # Flaws found by the same scan share a date, so each distinct date is only parsed once
+                getters.append(lambda attrib: shared_dates.share(attrib["date_first_occurrence"], _parse_date))
+        elif header in SHARED_FLAW_FIELDS and shared_strings is not None:
+            getters.append(_shared_getter(header, shared_strings))
+        else:
+            getters.append(itemgetter("issueid" if header == "id" else header))
+    return lambda attrib: flaw_model(*[getter(attrib) for getter in getters])
+
+
 class DataLoader:
-    def __init__(self, api, build_tools):
+    def __init__(self, api, build_tools, projection=None, flaw_table_threshold=None, budget=None):
         self.api = api
         self.build_tools = build_tools
+        self.budget = budget
+        # Reports with at least this many flaws are held in a columnar FlawTable instead of one object per flaw
+        self.flaw_table_threshold = flaw_table_threshold
+        self.projection = projection if projection is not None else Projection()
+        self.plan = RequestPlan()
+        self.shared_strings = ValueTable("Flaw strings")
+        self.shared_dates = ValueTable("Flaw dates")
 
     def _get_apps(self):
         """Returns a list of apps"""
@@ -42,7 +94,8 @@ class DataLoader:
 
         apps = []
         for app_element in app_elements:
-            apps.append(models.App(app_element.attrib["app_id"], app_element.attrib["app_name"]))
+            apps.append(models.App(app_element.attrib["app_id"], app_element.attrib["app_name"],
+                                   policy_updated_date=app_element.attrib.get("policy_updated_date")))
 
         return apps
 
@@ -69,7 +122,8 @@ class DataLoader:
         sandboxes = []
 
         for sandbox_element in sandbox_elements:
-            sandboxes.append(models.Sandbox(sandbox_element.attrib["sandbox_id"], sandbox_element.attrib["sandbox_name"]))
+            sandboxes.append(models.Sandbox(sandbox_element.attrib["sandbox_id"], sandbox_element.attrib["sandbox_name"],
+                                            last_modified=sandbox_element.attrib.get("last_modified")))
 
         return sandboxes
 
@@ -119,7 +173,7 @@ class DataLoader:
         return build_info_root_element.find("build")
         
     def _get_flaws(self, build_id, build_type):
-        """Returns a list of flaws"""
+        """Returns a list of flaws, or a FlawTable for very large reports"""
         try:
             detailed_report_xml = self.api.get_detailed_report(build_id)
         except VeracodeAPIError as e:
@@ -130,24 +184,20 @@ class DataLoader:
         # Use xpath to find all flaws in the detailed report
         findall_string = "severity/category/cwe/" + build_type + "flaws/flaw"
         flaw_elements = detailed_report_root_element.findall(findall_string)
-        flaw_elements.sort(key=lambda flaw: int(flaw.attrib["issueid"]))
-
-        flaws = []
-        for flaw_element in flaw_elements:
-            date_first_occurrence = parser.parse(flaw_element.attrib["date_first_occurrence"]).astimezone(pytz.utc)
-            if build_type == "static":
-                flaws.append(models.StaticFlaw(flaw_element.attrib["issueid"], date_first_occurrence,
-                                               flaw_element.attrib["severity"], flaw_element.attrib["cweid"],
-                                               flaw_element.attrib["categoryname"], flaw_element.attrib["affects_policy_compliance"],
-                                               flaw_element.attrib["remediationeffort"], flaw_element.attrib["remediation_status"],
-                                               flaw_element.attrib["mitigation_status_desc"], flaw_element.attrib["exploitLevel"],
-                                               flaw_element.attrib["module"], flaw_element.attrib["sourcefile"], flaw_element.attrib["line"]))
-            elif build_type == "dynamic":
-                flaws.append(models.DynamicFlaw(flaw_element.attrib["issueid"], date_first_occurrence,
-                                                flaw_element.attrib["severity"], flaw_element.attrib["cweid"],
-                                                flaw_element.attrib["categoryname"], flaw_element.attrib["affects_policy_compliance"],
-                                                flaw_element.attrib["remediationeffort"], flaw_element.attrib["remediation_status"],
-                                                flaw_element.attrib["mitigation_status_desc"], flaw_element.attrib["url"]))
+        flaw_fields = self.projection.flaw_fields(build_type)
+
+        if self.flaw_table_threshold is not None and len(flaw_elements) >= self.flaw_table_threshold:
+            flaws = FlawTable(flaw_fields, lambda date_string: self.shared_dates.share(date_string, _parse_date))
+            for flaw_element in flaw_elements:
+                flaws.append(flaw_element.attrib)
+            flaws = flaws.sorted_by_id()
+            logging.log(logging.INFO, "Build {}: {} flaws held in a flaw table, about {} bytes per flaw".format(
+                build_id, len(flaws), flaws.nbytes() // max(len(flaws), 1)))
+        else:
+            flaw_elements.sort(key=lambda flaw: int(flaw.attrib["issueid"]))
+            flaw_model = models.StaticFlaw if build_type == "static" else models.DynamicFlaw
+            read_flaw = compile_flaw_reader(flaw_model, flaw_fields, self.shared_strings, self.shared_dates)
+            flaws = [read_flaw(flaw_element.attrib) for flaw_element in flaw_elements]
 
         if build_type == "static":
             static_analysis_element = detailed_report_root_element.find("static-analysis")
@@ -158,56 +208,190 @@ class DataLoader:
         else:
             return flaws
 
-    def get_data(self, include_static_builds=True, include_dynamic_builds=True, app_include_list=None, include_sandboxes=False):
-        """Returns a list of populated apps"""
+    def _populate_build(self, app_id, build, sandbox_id=None):
+        """Fetches build info and flaws for a build that needs processing. Build info only holds the published date,
+        so it is skipped when that column is not exported."""
+        if self.projection.exports("build_published_date"):
+            analysis_unit_attrib = self._get_build_info(app_id, build.id, sandbox_id).find("analysis_unit").attrib
+            if "published_date" in analysis_unit_attrib:
+                published_date_string = analysis_unit_attrib["published_date"][:22] + analysis_unit_attrib["published_date"][23:]
+                build.published_date = parser.parse(published_date_string).astimezone(pytz.utc)
+        if build.type == "static":
+            build.flaws, build.analysis_size_bytes = self._get_flaws(build.id, build.type)
+        else:
+            build.flaws = self._get_flaws(build.id, build.type)
+
+    def _plan_build_list(self, app_id, signal_key, signal, target, get_builds):
+        """Returns the builds that need processing, skipping the build list call if the change marker is unchanged"""
+        if self.build_tools.signal_is_unchanged(signal_key, signal):
+            self.plan.call_avoided("getbuildlist", target, "unchanged since last run")
+            return []
+
+        builds = get_builds()
+        self.plan.call_made("getbuildlist", target)
+        builds = [build for build in builds if self.build_tools.build_should_be_processed(app_id, build.id, build.policy_updated_date)]
+        if not builds:
+            self.build_tools.update_signal(signal_key, signal)
+        return builds
+
+    def plan_data(self, include_static_builds=True, include_dynamic_builds=True, app_include_list=None, include_sandboxes=False,
+                  selector=None):
+        """Returns a list of apps holding only the builds that need processing, without fetching flaws"""
+        if selector is None:
+            selector = Selector(app_include_list)
+
+        self.plan = RequestPlan()
+        self.shared_strings = ValueTable("Flaw strings")
+        self.shared_dates = ValueTable("Flaw dates")
         apps = self._get_apps()
-        if app_include_list:
-            apps = [app for app in apps if app.name in app_include_list]
+        self.plan.call_made("getapplist", "account")
+        apps = [app for app in apps if selector.app_selected(app)]
 
         print("{} applications found in Veracode account".format(len(apps)))
 
+        # Change markers only hold for the build types they were recorded with
+        scope = "{}{}".format("s" if include_static_builds else "", "d" if include_dynamic_builds else "")
+
+        selected_apps = []
         for app in apps:
-            app_info = self._get_app_info(app.id)
-            app.business_unit = app_info["business_unit"]
-            builds = self._get_builds(app.id, include_static_builds, include_dynamic_builds)
-            app.builds = [build for build in builds if self.build_tools.build_should_be_processed(app.id, build.id, build.policy_updated_date)]
+            app_target = "app {}".format(app.id)
+            app_signal_key = "app:{}:{}".format(app.id, scope)
 
-            print(u"{}: {} policy builds".format(app.name, len(app.builds)))
+            # The business unit filter costs a getappinfo call, so it waits until an app has changed
+            if not self.build_tools.signal_is_unchanged(app_signal_key, app.policy_updated_date) and \
+                    not self._business_unit_selected(app, selector):
+                continue
+            app.builds = self._plan_build_list(app.id, app_signal_key, app.policy_updated_date, app_target,
+                                               lambda: self._get_builds(app.id, include_static_builds, include_dynamic_builds))
 
-            for build in app.builds:
-                analysis_unit_attrib = self._get_build_info(app.id, build.id).find("analysis_unit").attrib
-                if "published_date" in analysis_unit_attrib:
-                    published_date_string = analysis_unit_attrib["published_date"][:22] + analysis_unit_attrib["published_date"][23:]
-                    build.published_date = parser.parse(published_date_string).astimezone(pytz.utc)
-                if build.type == "static":
-                    build.flaws, build.analysis_size_bytes = self._get_flaws(build.id, build.type)
-                else:
-                    build.flaws = self._get_flaws(build.id, build.type)
+            print(u"{}: {} policy builds".format(app.name, len(app.builds)))
 
+            app.sandboxes = []
             if include_sandboxes:
-                app.sandboxes = self._get_sandboxes(app.id)
+                app.sandboxes = [sandbox for sandbox in self._get_sandboxes(app.id) if selector.sandbox_selected(sandbox)]
+                self.plan.call_made("getsandboxlist", app_target)
 
                 print(u"{}: {} sandboxes".format(app.name, len(app.sandboxes)))
 
                 for sandbox in app.sandboxes:
-                    builds = self._get_builds(app.id, include_static_builds, include_dynamic_builds, sandbox.id)
-                    sandbox.builds = [build for build in builds if self.build_tools.build_should_be_processed(app.id, build.id, build.policy_updated_date)]
-                    for build in sandbox.builds:
-                        analysis_unit_attrib = self._get_build_info(app.id, build.id, sandbox.id).find("analysis_unit").attrib
-                        if "published_date" in analysis_unit_attrib:
-                            published_date_string = analysis_unit_attrib["published_date"][:22] + analysis_unit_attrib["published_date"][23:]
-                            build.published_date = parser.parse(published_date_string).astimezone(pytz.utc)
-                        build.flaws, build.analysis_size_bytes = self._get_flaws(build.id, build.type)
+                    sandbox.builds = self._plan_build_list(app.id, "sandbox:{}:{}".format(sandbox.id, scope), sandbox.last_modified,
+                                                           "{} sandbox {}".format(app_target, sandbox.id),
+                                                           lambda: self._get_builds(app.id, include_static_builds,
+                                                                                    include_dynamic_builds, sandbox.id))
+
+            sandbox_builds = [(sandbox, build) for sandbox in app.sandboxes for build in sandbox.builds]
+            if sandbox_builds and not self._business_unit_selected(app, selector):
+                continue
+            selected_apps.append(app)
+            if app.business_unit is None:
+                if not self.projection.exports("app_business_unit"):
+                    self.plan.call_avoided("getappinfo", app_target, "column not exported")
+                elif app.builds or sandbox_builds:
+                    self.plan.call_planned("getappinfo", app_target)
+                else:
+                    self.plan.call_avoided("getappinfo", app_target, "no builds to process")
+            build_targets = ["{} build {}".format(app_target, build.id) for build in app.builds]
+            build_targets += ["{} sandbox {} build {}".format(app_target, sandbox.id, build.id) for sandbox, build in sandbox_builds]
+            for build_target in build_targets:
+                if self.projection.exports("build_published_date"):
+                    self.plan.call_planned("getbuildinfo", build_target)
+                else:
+                    self.plan.call_avoided("getbuildinfo", build_target, "column not exported")
+                self.plan.call_planned("detailedreport", build_target)
+
+        return selected_apps
+
+    def _business_unit_selected(self, app, selector):
+        """Looks up the app's business unit if the selector filters on it, returning False if the app is filtered out"""
+        if not selector.needs_business_unit():
+            return True
+        if app.business_unit is None:
+            # Business units are cached until the app changes, so apps filtered out are not looked up on every run
+            cache_key = "business_unit:{}".format(app.id)
+            app.business_unit = self.build_tools.get_cached_value(cache_key, app.policy_updated_date)
+            if app.business_unit is None:
+                app.business_unit = self._get_app_info(app.id)["business_unit"]
+                self.plan.call_made("getappinfo", "app {}".format(app.id))
+                self.build_tools.cache_value(cache_key, app.policy_updated_date, app.business_unit)
+            else:
+                self.plan.call_avoided("getappinfo", "app {}".format(app.id), "business unit cached")
+        return selector.business_unit_selected(app.business_unit)
+
+    def claim_builds(self, apps):
+        """Keeps only the planned builds this run could claim, dropping those another run is working on"""
+        builds = [(app.id, build.id, build.policy_updated_date) for app in apps for build in app.builds]
+        builds += [(app.id, build.id, build.policy_updated_date) for app in apps for sandbox in app.sandboxes
+                   for build in sandbox.builds]
+        claimed = set(self.build_tools.claim_builds(builds))
+        for app in apps:
+            app.builds = [build for build in app.builds if (app.id, build.id) in claimed]
+            for sandbox in app.sandboxes:
+                sandbox.builds = [build for build in sandbox.builds if (app.id, build.id) in claimed]
+        if len(claimed) < len(builds):
+            logging.log(logging.INFO, "{} builds left to other runs".format(len(builds) - len(claimed)))
+            print("{} builds left to other runs".format(len(builds) - len(claimed)))
+        return apps
 
+    def fetch_data(self, apps, workers=1):
+        """Populates planned apps with app info, build info and flaws, fetching the largest builds first.
+        Builds that could not be fetched within the time budget are dropped and left for the next run."""
+        jobs = []
+        for app in apps:
+            sandbox_builds = [(sandbox, build) for sandbox in app.sandboxes for build in sandbox.builds]
+            if not app.builds and not sandbox_builds:
+                continue
+            if self.budget_expired():
+                break
+
+            if app.business_unit is None and self.projection.exports("app_business_unit"):
+                try:
+                    app.business_unit = self._get_app_info(app.id)["business_unit"]
+                except VeracodeError:
+                    if self.budget_expired():
+                        break
+                    raise
+
+            for build in app.builds:
+                jobs.append(FetchJob(app, build, expected_cost=self.build_tools.get_expected_cost(app.id, build.id)))
+            for sandbox, build in sandbox_builds:
+                jobs.append(FetchJob(app, build, sandbox, self.build_tools.get_expected_cost(app.id, build.id)))
+
+        FetchScheduler(workers, self.budget).run(jobs, lambda job: self._populate_build(job.app.id, job.build,
+                                                                                        job.sandbox.id if job.sandbox else None))
+        for line in self.memory_report():
+            logging.log(logging.INFO, line)
+
+        unfetched = 0
+        for app in apps:
+            fetched_builds = [build for build in app.builds if build.flaws is not None]
+            unfetched += len(app.builds) - len(fetched_builds)
+            app.builds = fetched_builds
+            for sandbox in app.sandboxes:
+                fetched_builds = [build for build in sandbox.builds if build.flaws is not None]
+                unfetched += len(sandbox.builds) - len(fetched_builds)
+                sandbox.builds = fetched_builds
+        if unfetched:
+            # Only a spent time budget may leave builds behind, anything else is a failure
+            if not self.budget_expired():
+                logging.error("{} builds were not fetched".format(unfetched))
+                raise VeracodeError("{} builds were not fetched".format(unfetched))
+            logging.log(logging.WARNING, "Time budget used up, {} builds left for the next run".format(unfetched))
+            print("Time budget used up, {} builds left for the next run".format(unfetched))
         return apps
 
+    def budget_expired(self):
+        return self.budget is not None and self.budget.expired()
+
+    def memory_report(self):
+        """Returns lines describing how much memory the shared value tables saved"""
+        return [self.shared_strings.summary(), self.shared_dates.summary()]
+
+    def get_data(self, include_static_builds=True, include_dynamic_builds=True, app_include_list=None, include_sandboxes=False,
+                 selector=None):
+        """Returns a list of populated apps"""
+        apps = self.plan_data(include_static_builds, include_dynamic_builds, app_include_list, include_sandboxes, selector)
+        return self.fetch_data(apps)
+
     def get_headers(self, build_type, include_sandbox=False):
         """Returns headers for a csv file"""
-        app_headers = ["app_" + header for header in models.App.to_headers()]
-        build_headers = ["build_" + header for header in (models.StaticBuild.to_headers() if build_type == "static" else models.DynamicBuild.to_headers())]
-        flaw_headers = ["flaw_" + header for header in(models.StaticFlaw.to_headers() if build_type == "static" else models.DynamicFlaw.to_headers())]
-        headers = app_headers + build_headers + flaw_headers
-        if include_sandbox:
-            headers += ["sandbox_" + header for header in models.Sandbox.to_headers()]
-
-        return headers
+        return self.projection.headers(build_type, include_sandbox)
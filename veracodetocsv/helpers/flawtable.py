@@ -0,0 +1,167 @@
+# Purpose:  Columnar flaw storage for very large builds
+#
+# Notes:    A FlawTable holds each flaw attribute in its own compact column instead of one object per flaw. Integer
+#           attributes and dates (as epoch seconds) live in stdlib arrays, everything else is dictionary encoded. If
+#           NumPy is installed it is used for sorting and filtering, otherwise the same operations run in Python.
+
+import sys
+import calendar
+from array import array
+try:
+    from itertools import izip
+except ImportError:
+    # Python 3 zip is already lazy
+    izip = zip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INTEGER_FIELDS = frozenset(["id", "severity", "cweid", "line"])
+
+
+def _take(column, indices):
+    """Returns a copy of an array holding only the items at the given indices"""
+    if numpy is not None and not isinstance(indices, list):
+        taken = array(column.typecode)
+        # Python 2 arrays only have fromstring
+        frombytes = getattr(taken, "frombytes", None) or taken.fromstring
+        frombytes(numpy.frombuffer(column, dtype=column.typecode)[indices].tobytes())
+        return taken
+    return array(column.typecode, [column[i] for i in indices])
+
+
+class IntegerColumn(object):
+    def __init__(self, values=None):
+        self.values = values if values is not None else array("l")
+
+    def append(self, raw_value):
+        self.values.append(int(raw_value))
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def take(self, indices):
+        return IntegerColumn(_take(self.values, indices))
+
+    def nbytes(self):
+        return self.values.itemsize * len(self.values)
+
+
+class DateColumn(object):
+    """Holds dates as epoch seconds, handing back one shared datetime per distinct date"""
+    def __init__(self, parse_date, epochs=None, datetimes=None):
+        self.parse_date = parse_date
+        self.epochs = epochs if epochs is not None else array("d")
+        self.datetimes = datetimes if datetimes is not None else {}
+
+    def append(self, raw_value):
+        date = self.parse_date(raw_value)
+        epoch = calendar.timegm(date.utctimetuple()) + date.microsecond / 1e6
+        self.datetimes.setdefault(epoch, date)
+        self.epochs.append(epoch)
+
+    def __iter__(self):
+        return (self.datetimes[epoch] for epoch in self.epochs)
+
+    def take(self, indices):
+        return DateColumn(self.parse_date, _take(self.epochs, indices), self.datetimes)
+
+    def nbytes(self):
+        return self.epochs.itemsize * len(self.epochs) + sum(sys.getsizeof(date) for date in self.datetimes.values())
+
+
+class EncodedColumn(object):
+    """Holds each distinct string once and one integer code per flaw"""
+    def __init__(self, codes=None, values=None, value_codes=None):
+        self.codes = codes if codes is not None else array("i")
+        self.values = values if values is not None else []
+        self.value_codes = value_codes if value_codes is not None else {}
+
+    def append(self, raw_value):
+        code = self.value_codes.get(raw_value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(raw_value)
+            self.value_codes[raw_value] = code
+        self.codes.append(code)
+
+    def __iter__(self):
+        return (self.values[code] for code in self.codes)
+
+    def take(self, indices):
+        return EncodedColumn(_take(self.codes, indices), self.values, self.value_codes)
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + sum(sys.getsizeof(value) for value in self.values)
+
+
+class FlawTable(object):
+    """A class that holds the flaws of one build in columns"""
+    def __init__(self, fields, parse_date, columns=None, size=0):
+        self.fields = list(fields)
+        self.parse_date = parse_date
+        self.size = size
+        if columns is not None:
+            self.columns = columns
+        else:
+            self.columns = {}
+            # Flaws are always ordered by id, so the id column is kept even when it is not exported
+            for field in set(self.fields) | set(["id"]):
+                if field in INTEGER_FIELDS:
+                    self.columns[field] = IntegerColumn()
+                elif field == "date_first_occurrence":
+                    self.columns[field] = DateColumn(parse_date)
+                else:
+                    self.columns[field] = EncodedColumn()
+        self.appenders = [(column.append, "issueid" if field == "id" else field) for field, column in self.columns.items()]
+
+    def __len__(self):
+        return self.size
+
+    def append(self, attrib):
+        """Adds a flaw from a flaw element's attributes"""
+        for append, name in self.appenders:
+            append(attrib[name])
+        self.size += 1
+
+    def _integers(self, field):
+        return self.columns[field].values
+
+    def take(self, indices):
+        """Returns a new table holding only the flaws at the given indices"""
+        columns = dict((field, column.take(indices)) for field, column in self.columns.items())
+        return FlawTable(self.fields, self.parse_date, columns, len(indices))
+
+    def sorted_by_id(self):
+        ids = self._integers("id")
+        if not ids:
+            return self
+        if numpy is not None:
+            order = numpy.argsort(numpy.frombuffer(ids, dtype=ids.typecode), kind="stable")
+        else:
+            order = sorted(range(len(ids)), key=ids.__getitem__)
+        return self.take(order)
+
+    def filter_minimum(self, field, minimum):
+        """Returns a new table holding the flaws whose integer field is at least minimum, e.g. severity >= 4"""
+        values = self._integers(field)
+        if numpy is not None and values:
+            indices = numpy.flatnonzero(numpy.frombuffer(values, dtype=values.typecode) >= minimum)
+        else:
+            indices = [i for i, value in enumerate(values) if value >= minimum]
+        return self.take(indices)
+
+    def filter_severity(self, minimum):
+        return self.filter_minimum("severity", minimum)
+
+    def rows(self, fields):
+        """Yields a tuple of the given fields for every flaw"""
+        if not fields:
+            return (() for _ in range(self.size))
+        return izip(*[iter(self.columns[field]) for field in fields])
+
+    def nbytes(self):
+        """Returns an estimate of the memory used by the table's columns"""
+        return sum(column.nbytes() for column in self.columns.values())
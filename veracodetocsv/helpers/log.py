@@ -1,11 +1,23 @@
 # Purpose:  Log utilities
 
+import atexit
 import logging
 import time
 from datetime import datetime
+try:
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # Python 2 has no queue handlers, so it logs straight to the file
+    QueueHandler = None
 
+# Largest part of a request or response body written to the debug log
+DEBUG_PAYLOAD_BYTES = 4096
+
+
+def setup_logging(debug=False, debug_payload_bytes=None):
+    global DEBUG_PAYLOAD_BYTES
 
-def setup_logging(debug=False):
     now = datetime.utcnow().strftime("%Y-%m-%d-%H%M%S")
     format_string = "%(asctime)s %(levelname)s %(message)s"
     datetime_format = '%Y-%m-%d %H:%M:%S %Z'
@@ -13,9 +25,31 @@ def setup_logging(debug=False):
     logging.captureWarnings(True)
     logging.Formatter.converter = time.gmtime
 
-    if debug:
-        logging.basicConfig(format=format_string, datefmt=datetime_format, filename="{}-debug.log".format(now), level=logging.DEBUG)
+    if debug_payload_bytes is not None:
+        DEBUG_PAYLOAD_BYTES = debug_payload_bytes
+
+    file_handler = logging.FileHandler("{}-debug.log".format(now) if debug else "{}.log".format(now))
+    file_handler.setFormatter(logging.Formatter(format_string, datetime_format))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    if QueueHandler is None:
+        root_logger.addHandler(file_handler)
     else:
-        logging.basicConfig(format=format_string, datefmt=datetime_format, filename="{}.log".format(now), level=logging.INFO)
+        # Threads only put records on a queue, a background listener does the file writes
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, file_handler)
+        root_logger.addHandler(QueueHandler(log_queue))
+        listener.start()
+        atexit.register(listener.stop)
+
+    if not debug:
         requests_logger = logging.getLogger("requests")
         requests_logger.setLevel(logging.WARNING)
+
+
+def truncate_payload(payload):
+    """Returns a request or response body cut down to DEBUG_PAYLOAD_BYTES for the debug log"""
+    if payload is None or len(payload) <= DEBUG_PAYLOAD_BYTES:
+        return payload
+    return "{!r}... ({} more bytes)".format(payload[:DEBUG_PAYLOAD_BYTES], len(payload) - DEBUG_PAYLOAD_BYTES)
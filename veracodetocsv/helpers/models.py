@@ -138,10 +138,11 @@ class DynamicBuild(Build):
 
 class Sandbox(object):
     """A class that represents a sandbox"""
-    def __init__(self, id, name, builds=None):
+    def __init__(self, id, name, builds=None, last_modified=None):
         self.id = id
         self.name = name
         self.builds = builds
+        self.last_modified = last_modified
 
     @classmethod
     def to_headers(cls):
@@ -156,12 +157,13 @@ class Sandbox(object):
 
 class App(object):
     """A class that represents an application"""
-    def __init__(self, id, name, business_unit=None, sandboxes=None, builds=None):
+    def __init__(self, id, name, business_unit=None, sandboxes=None, builds=None, policy_updated_date=None):
         self.id = id
         self.name = name
         self.business_unit = business_unit
         self.sandboxes = sandboxes
         self.builds = builds
+        self.policy_updated_date = policy_updated_date
 
     @classmethod
     def to_headers(cls):
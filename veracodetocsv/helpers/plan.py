@@ -0,0 +1,46 @@
+# Purpose:  Request planning utilities
+
+
+class PlannedCall(object):
+    """A class that represents an API call made, planned or avoided by a run"""
+    def __init__(self, call, target, reason=None):
+        self.call = call
+        self.target = target
+        self.reason = reason
+
+    def __str__(self):
+        if self.reason is None:
+            return "{} {}".format(self.call, self.target)
+        return "{} {} ({})".format(self.call, self.target, self.reason)
+
+
+class RequestPlan:
+    """Records which API calls a run made while planning, which it still has to make, and which it avoided"""
+    def __init__(self):
+        self.made = []
+        self.planned = []
+        self.avoided = []
+
+    def call_made(self, call, target):
+        self.made.append(PlannedCall(call, target))
+
+    def call_planned(self, call, target):
+        self.planned.append(PlannedCall(call, target))
+
+    def call_avoided(self, call, target, reason):
+        self.avoided.append(PlannedCall(call, target, reason))
+
+    def summary(self):
+        return "{} API calls made while planning, {} planned, {} avoided".format(len(self.made), len(self.planned),
+                                                                                len(self.avoided))
+
+    def to_lines(self):
+        """Returns the plan as a list of printable lines"""
+        lines = ["Calls made while planning:"]
+        lines += ["  " + str(planned_call) for planned_call in self.made]
+        lines.append("Calls planned:")
+        lines += ["  " + str(planned_call) for planned_call in self.planned]
+        lines.append("Calls avoided:")
+        lines += ["  " + str(planned_call) for planned_call in self.avoided]
+        lines.append(self.summary())
+        return lines
@@ -0,0 +1,91 @@
+# Purpose:  Column selection utilities
+#
+# Notes:    Columns are named as in the CSV headers, e.g. app_name, build_id, flaw_severity, sandbox_name. Selected
+#           columns are always written in the usual app, build, flaw, sandbox order.
+
+import logging
+from operator import attrgetter
+try:
+    from itertools import imap
+except ImportError:
+    # Python 3 map is already lazy
+    imap = map
+
+from veracodetocsv.helpers import models
+from veracodetocsv.helpers.flawtable import FlawTable
+from veracodetocsv.helpers.exceptions import VeracodeError
+
+
+def _tuple_getter(fields):
+    """Returns a function that reads the given attributes of an object into a tuple"""
+    if not fields:
+        return lambda obj: ()
+    if len(fields) == 1:
+        getter = attrgetter(fields[0])
+        return lambda obj: (getter(obj),)
+    return attrgetter(*fields)
+
+
+class RowExtractor:
+    """Builds CSV rows for the flaws of one build from precompiled attribute getters"""
+    def __init__(self, app_fields, build_fields, flaw_fields, sandbox_fields):
+        self.flaw_fields = flaw_fields
+        self.get_app_values = _tuple_getter(app_fields)
+        self.get_build_values = _tuple_getter(build_fields)
+        self.get_flaw_values = _tuple_getter(flaw_fields)
+        self.get_sandbox_values = _tuple_getter(sandbox_fields)
+
+    def rows(self, app, build, sandbox=None):
+        # App, build and sandbox values are the same on every row of a build, so they are only read once
+        prefix = self.get_app_values(app) + self.get_build_values(build)
+        suffix = self.get_sandbox_values(sandbox) if sandbox is not None else ()
+        if isinstance(build.flaws, FlawTable):
+            flaw_values = build.flaws.rows(self.flaw_fields)
+        else:
+            flaw_values = imap(self.get_flaw_values, build.flaws)
+        for values in flaw_values:
+            yield prefix + values + suffix
+
+
+class Projection:
+    """Decides which columns are exported. With no columns given every column is exported."""
+    def __init__(self, columns=None):
+        self.columns = frozenset(columns) if columns else None
+        if self.columns is not None:
+            known_columns = set(self._headers("app_", models.App) + self._headers("build_", models.StaticBuild) +
+                                self._headers("flaw_", models.StaticFlaw) + self._headers("flaw_", models.DynamicFlaw) +
+                                self._headers("sandbox_", models.Sandbox))
+            unknown_columns = self.columns - known_columns
+            if unknown_columns:
+                logging.error("Unknown columns: {}".format(", ".join(sorted(unknown_columns))))
+                raise VeracodeError("Unknown columns: {}".format(", ".join(sorted(unknown_columns))))
+
+    @staticmethod
+    def _headers(prefix, model):
+        return [prefix + header for header in model.to_headers()]
+
+    def _fields(self, prefix, model):
+        return [header for header in model.to_headers() if self.columns is None or prefix + header in self.columns]
+
+    def _field_groups(self, build_type, include_sandbox):
+        build_model = models.StaticBuild if build_type == "static" else models.DynamicBuild
+        flaw_model = models.StaticFlaw if build_type == "static" else models.DynamicFlaw
+        return (self._fields("app_", models.App), self._fields("build_", build_model),
+                self._fields("flaw_", flaw_model), self._fields("sandbox_", models.Sandbox) if include_sandbox else [])
+
+    def exports(self, column):
+        """Returns True if a column such as build_published_date is written to the CSV files"""
+        return self.columns is None or column in self.columns
+
+    def flaw_fields(self, build_type):
+        """Returns the flaw attributes that have to be read from a detailed report"""
+        return self._field_groups(build_type, False)[2]
+
+    def headers(self, build_type, include_sandbox=False):
+        """Returns headers for a csv file"""
+        app_fields, build_fields, flaw_fields, sandbox_fields = self._field_groups(build_type, include_sandbox)
+        return (["app_" + field for field in app_fields] + ["build_" + field for field in build_fields] +
+                ["flaw_" + field for field in flaw_fields] + ["sandbox_" + field for field in sandbox_fields])
+
+    def row_extractor(self, build_type, include_sandbox=False):
+        return RowExtractor(*self._field_groups(build_type, include_sandbox))
@@ -0,0 +1,82 @@
+# Purpose:  Fetch scheduling utilities
+
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from veracodetocsv.helpers.exceptions import VeracodeError
+
+
+class FetchJob(object):
+    """A class that represents a build waiting for its build info and detailed report"""
+    def __init__(self, app, build, sandbox=None, expected_cost=0):
+        self.app = app
+        self.build = build
+        self.sandbox = sandbox
+        self.expected_cost = expected_cost
+
+
+class FetchScheduler:
+    """Runs fetch jobs longest first on a pool of worker threads, reporting progress with an ETA. Once the time
+    budget runs out no new jobs are started and jobs that fail are left for the next run."""
+    def __init__(self, workers=1, budget=None):
+        self.workers = max(1, workers)
+        self.budget = budget
+        self.lock = threading.Lock()
+
+    def run(self, jobs, fetch):
+        # Starting the most expensive builds first keeps one large report from finishing long after the others.
+        # Jobs are popped from the end, so sort cheapest first.
+        pending = sorted(jobs, key=lambda job: job.expected_cost)
+        errors = []
+        # Every job costs at least one round trip, even for builds with no recorded flaws
+        total_cost = sum(job.expected_cost + 1 for job in pending)
+        progress = {"jobs": 0, "cost": 0}
+        total_jobs = len(pending)
+        start = time.time()
+
+        def work():
+            while True:
+                with self.lock:
+                    if not pending or errors or (self.budget is not None and self.budget.expired()):
+                        return
+                    job = pending.pop()
+                try:
+                    fetch(job)
+                except VeracodeError as e:
+                    if self.budget is not None and self.budget.expired():
+                        return
+                    with self.lock:
+                        errors.append(e)
+                    return
+                except Exception as e:
+                    # Anything else, such as a malformed report, would otherwise end the thread silently
+                    logging.exception("Failed to fetch build")
+                    with self.lock:
+                        errors.append(e)
+                    return
+                with self.lock:
+                    progress["jobs"] += 1
+                    progress["cost"] += job.expected_cost + 1
+                    self._report(progress, total_jobs, total_cost, time.time() - start)
+
+        threads = [threading.Thread(target=work) for _ in range(min(self.workers, total_jobs))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # Join with a timeout so that KeyboardInterrupt still reaches the main thread
+            while thread.is_alive():
+                thread.join(0.5)
+
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def _report(progress, total_jobs, total_cost, elapsed):
+        remaining = elapsed * (total_cost - progress["cost"]) / progress["cost"]
+        message = "{}/{} builds fetched, about {} remaining".format(progress["jobs"], total_jobs,
+                                                                    timedelta(seconds=int(remaining)))
+        logging.log(logging.INFO, message)
+        print(message)
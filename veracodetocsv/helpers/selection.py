@@ -0,0 +1,86 @@
+# Purpose:  App and sandbox selection utilities
+#
+# Notes:    Patterns are exact names by default. Prefix a pattern with "glob:" to use shell-style wildcards or with
+#           "re:" to use a regular expression matched against the whole name, for example
+#
+#           glob:payments-*
+#           re:(web|api)-\d+
+
+import re
+import fnmatch
+import logging
+
+from veracodetocsv.helpers.exceptions import VeracodeError
+
+
+class PatternMatcher:
+    """Matches names against a set of exact names and a list of compiled regular expressions"""
+    def __init__(self, patterns=None):
+        self.exact_names = set()
+        self.fullmatchers = []
+        for pattern in patterns or []:
+            if not pattern.strip():
+                continue
+            if pattern.startswith("glob:"):
+                self.fullmatchers.append(self._compile(fnmatch.translate(pattern[5:])))
+            elif pattern.startswith("re:"):
+                # Each expression is compiled on its own so that inline flags such as (?i) stay at its start
+                self.fullmatchers.append(self._compile(pattern[3:]))
+            else:
+                self.exact_names.add(pattern)
+        self.size = len(self.exact_names) + len(self.fullmatchers)
+
+    @staticmethod
+    def _compile(expression):
+        """Returns a function matching the whole name against an expression"""
+        try:
+            compiled = re.compile(expression)
+            if hasattr(compiled, "fullmatch"):
+                return compiled.fullmatch
+            # Python 2 has no fullmatch, but accepts inline flags anywhere in an expression
+            return re.compile(r"(?:{})\Z".format(expression)).match
+        except re.error as e:
+            logging.exception("Error compiling selection pattern")
+            raise VeracodeError(e)
+
+    def __len__(self):
+        return self.size
+
+    def matches(self, name):
+        if name in self.exact_names:
+            return True
+        if name is None:
+            return False
+        return any(fullmatch(name) is not None for fullmatch in self.fullmatchers)
+
+
+class Selector:
+    """Decides which apps and sandboxes a run processes. An app or sandbox must pass every filter that is set."""
+    def __init__(self, app_include_list=None, app_exclude_list=None, business_units=None, app_ids=None,
+                 sandbox_include_list=None, sandbox_exclude_list=None):
+        self.app_include = PatternMatcher(app_include_list)
+        self.app_exclude = PatternMatcher(app_exclude_list)
+        self.business_units = PatternMatcher(business_units)
+        self.app_ids = frozenset(str(app_id) for app_id in app_ids or [])
+        self.sandbox_include = PatternMatcher(sandbox_include_list)
+        self.sandbox_exclude = PatternMatcher(sandbox_exclude_list)
+
+    def app_selected(self, app):
+        """Returns True if an app passes the filters that only need the app list"""
+        if self.app_ids and app.id not in self.app_ids:
+            return False
+        if self.app_include and not self.app_include.matches(app.name):
+            return False
+        return not self.app_exclude.matches(app.name)
+
+    def needs_business_unit(self):
+        """Returns True if apps have to be looked up with getappinfo before they can be selected"""
+        return len(self.business_units) > 0
+
+    def business_unit_selected(self, business_unit):
+        return not self.business_units or self.business_units.matches(business_unit)
+
+    def sandbox_selected(self, sandbox):
+        if self.sandbox_include and not self.sandbox_include.matches(sandbox.name):
+            return False
+        return not self.sandbox_exclude.matches(sandbox.name)
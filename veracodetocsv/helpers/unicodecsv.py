@@ -40,7 +40,7 @@ class UnicodeWriter:
 
 
 def create_csv(row_list, filepath):
-    """Create a new CSV file from a list of rows."""
+    """Create a new CSV file from a list or other iterable of rows."""
     try:
         with open(filepath, 'w') as f:
             if sys.version_info >= (3,):
@@ -0,0 +1,31 @@
+# Purpose:  Shared value utilities
+
+import sys
+
+
+class ValueTable:
+    """Keeps one copy of each distinct value so that flaws repeating a value all point at the same object"""
+    def __init__(self, name):
+        self.name = name
+        self.values = {}
+        self.lookups = 0
+        self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def share(self, key, convert=None):
+        """Returns the shared copy of key, or of convert(key) when given, converting each distinct key only once"""
+        self.lookups += 1
+        value = self.values.get(key)
+        if value is None:
+            value = key if convert is None else convert(key)
+            self.values[key] = value
+        else:
+            # The duplicate is released along with the parsed report
+            self.bytes_saved += sys.getsizeof(value)
+        return value
+
+    def summary(self):
+        return "{}: {} distinct values shared across {} lookups, about {} KB saved".format(
+            self.name, len(self.values), self.lookups, self.bytes_saved // 1024)
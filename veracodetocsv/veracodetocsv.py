@@ -11,7 +11,10 @@ except ImportError:
 import os
 import re
 import sys
+import time
 import codecs
+import random
+import itertools
 import argparse
 import logging
 from datetime import datetime
@@ -20,7 +23,11 @@ from veracodetocsv.helpers import log
 from veracodetocsv.helpers import api
 from veracodetocsv.helpers import unicodecsv
 from veracodetocsv.helpers.data import DataLoader
-from veracodetocsv.helpers.build import BuildTools
+from veracodetocsv.helpers.build import BuildTools, RUN_LOCK_FILE
+from veracodetocsv.helpers.lock import FileLock
+from veracodetocsv.helpers.selection import Selector
+from veracodetocsv.helpers.projection import Projection
+from veracodetocsv.helpers.budget import TimeBudget
 from veracodetocsv.helpers.exceptions import VeracodeError
 
 
@@ -35,7 +42,16 @@ def main():
     parser.add_argument("-c", "--config", help="Configuration file")
     parser.add_argument("-o", "--outputdir", help="Output directory")
     parser.add_argument("-a", "--appincludelist", help="Text file containing list of application profile names to include")
+    parser.add_argument("-x", "--appexcludelist", help="Text file containing list of application profile names to exclude")
+    parser.add_argument("--columns", help="Comma separated list of columns to export, e.g. app_name,build_id,flaw_id")
+    parser.add_argument("-w", "--workers", help="Number of builds to fetch in parallel", type=int)
     parser.add_argument("-d", "--debug", help="Enable debug logging", action="store_true")
+    parser.add_argument("-p", "--plan", help="List the API calls a run would make and avoid, without downloading reports "
+                                             "or writing files", action="store_true")
+    parser.add_argument("--time-budget", help="Stop fetching after MINUTES minutes, leaving unfetched builds for the "
+                                              "next run", type=float, metavar="MINUTES")
+    parser.add_argument("--watch", help="Keep running, checking for new builds every MINUTES minutes", type=float,
+                        metavar="MINUTES")
     args = parser.parse_args()
 
     if args.config:
@@ -52,16 +68,27 @@ def main():
     include_dynamic_builds = getattr(config, "include_dynamic_flaws", True)
     include_sandboxes = getattr(config, "include_sandboxes", True)
     include_csv_headers = getattr(config, "include_csv_headers", True)
+    columns = [column.strip() for column in args.columns.split(",")] if args.columns else getattr(config, "columns", None)
     output_directory = args.outputdir if args.outputdir else getattr(config, "output_directory", "output")
     proxies = getattr(config, "proxies", None)
+    fetch_workers = args.workers if args.workers else getattr(config, "fetch_workers", 1)
     debug_logging = args.debug if args.debug else getattr(config, "debug_logging", False)
+    watch_interval = args.watch if args.watch else getattr(config, "watch_interval", None)
+    watch_jitter = getattr(config, "watch_jitter", 0.1)
+    time_budget = args.time_budget if args.time_budget else getattr(config, "time_budget", None)
+    concurrent_runs = getattr(config, "concurrent_runs", "exit")
 
-    log.setup_logging(debug_logging)
+    log.setup_logging(debug_logging, getattr(config, "debug_payload_bytes", None))
+
+    if concurrent_runs not in ("exit", "share"):
+        logging.error("Unknown concurrent_runs value {!r}, expected \"exit\" or \"share\"".format(concurrent_runs))
+        print("Invalid concurrent_runs setting, check log file for details.")
+        sys.exit(2)
 
     logging.log(logging.INFO, "Starting data download")
     print("Starting data download")
 
-    if not (os.path.exists(output_directory) and
+    if not args.plan and not (os.path.exists(output_directory) and
             os.path.exists(os.path.join(output_directory, "static")) and
             os.path.exists(os.path.join(output_directory, "dynamic"))):
         try:
@@ -72,35 +99,60 @@ def main():
             print("Cannot create output directory, check log file for details.")
             sys.exit(2)
 
+    # Held until the process exits
+    run_lock = FileLock(RUN_LOCK_FILE)
+    if not args.plan and concurrent_runs != "share" and not run_lock.acquire(blocking=False):
+        logging.log(logging.WARNING, "Another run is in progress, exiting")
+        print("Another run is in progress, exiting")
+        return
+
     try:
-        build_tools = BuildTools()
+        build_tools = BuildTools(getattr(config, "claim_lease_minutes", 120) * 60)
     except VeracodeError:
         print("Error getting processed build history, check log file for details.")
         sys.exit(2)
 
-    veracode_api = api.VeracodeAPI(proxies=proxies)
-    data_loader = DataLoader(veracode_api, build_tools)
+    try:
+        projection = Projection(columns)
+    except VeracodeError:
+        print("Invalid column selection, check log file for details.")
+        sys.exit(2)
+
+    budget = TimeBudget(time_budget * 60 if time_budget else None)
+    veracode_api = api.VeracodeAPI(proxies=proxies, timeouts=getattr(config, "request_timeouts", None),
+                                   hedge_after=getattr(config, "hedge_reports_after", None), budget=budget)
+    data_loader = DataLoader(veracode_api, build_tools, projection, getattr(config, "flaw_table_threshold", 10000),
+                             budget)
+    row_extractors = dict(((build_type, include_sandbox), projection.row_extractor(build_type, include_sandbox))
+                          for build_type in ["static", "dynamic"] for include_sandbox in [False, True])
 
-    app_include_list_file = args.appincludelist if args.appincludelist else getattr(config, "app_include_list", None)
-    if app_include_list_file:
+    def read_list_file(list_file, description):
+        if not list_file:
+            return []
         try:
-            with codecs.open(app_include_list_file, "r", "utf-8") as f:
-                app_include_list = f.read().splitlines()
+            with codecs.open(list_file, "r", "utf-8") as f:
+                return f.read().splitlines()
         except (IOError, UnicodeDecodeError):
-            logging.exception("Error opening app include list file")
-            print("Error opening app include list file, check log file for details.")
+            logging.exception("Error opening {} file".format(description))
+            print("Error opening {} file, check log file for details.".format(description))
             sys.exit(2)
-    else:
-        app_include_list = []
+
+    app_include_list = read_list_file(args.appincludelist if args.appincludelist else getattr(config, "app_include_list", None),
+                                      "app include list")
+    app_exclude_list = read_list_file(args.appexcludelist if args.appexcludelist else getattr(config, "app_exclude_list", None),
+                                      "app exclude list")
 
     if len(app_include_list) > 0:
         print("{} applications in app include list".format(len(app_include_list)))
+    if len(app_exclude_list) > 0:
+        print("{} applications in app exclude list".format(len(app_exclude_list)))
 
     try:
-        data = data_loader.get_data(include_static_builds, include_dynamic_builds, app_include_list,
-                                    include_sandboxes)
+        selector = Selector(app_include_list, app_exclude_list, getattr(config, "business_units", None),
+                            getattr(config, "app_ids", None), getattr(config, "sandbox_include_list", None),
+                            getattr(config, "sandbox_exclude_list", None))
     except VeracodeError:
-        print("Failed to get app data, check log file for details.")
+        print("Invalid selection pattern, check log file for details.")
         sys.exit(2)
 
     def make_filepath(app, build, sandbox=None):
@@ -114,37 +166,92 @@ def main():
         return os.path.join(scan_type_output_directory, filename)
 
     def process_build(app, build, sandbox=None):
-        flaw_rows = []
+        # Rows are streamed into the file rather than built up in a list, so a FlawTable keeps its memory saving
+        flaw_rows = row_extractors[build.type, sandbox is not None].rows(app, build, sandbox)
         if include_csv_headers:
-            flaw_rows.append(data_loader.get_headers(build.type, sandbox is not None))
-        for flaw in build.flaws:
-            if sandbox is None:
-                flaw_rows.append(app.to_list() + build.to_list() + flaw.to_list())
-            else:
-                flaw_rows.append(app.to_list() + build.to_list() + flaw.to_list() + sandbox.to_list())
+            flaw_rows = itertools.chain([projection.headers(build.type, sandbox is not None)], flaw_rows)
         filepath = make_filepath(app, build, sandbox)
         unicodecsv.create_csv(flaw_rows, filepath)
-        build_tools.update_and_save_processed_builds_file(app.id, build.id, build.policy_updated_date)
-
-    logging.log(logging.INFO, "Writing CSV files")
-    print("Writing CSV files")
-
-    for app in data:
-        # Iterate over policy builds
-        for build in app.builds:
-            try:
-                process_build(app, build)
-            except VeracodeError:
-                logging.exception("Failed to process build")
-
-        # Iterate over sandbox builds
-        if include_sandboxes:
-            for sandbox in app.sandboxes:
-                for build in sandbox.builds:
-                    try:
-                        process_build(app, build, sandbox)
-                    except VeracodeError:
-                        logging.exception("Failed to process build")
+        build_tools.update_and_save_processed_builds_file(app.id, build.id, build.policy_updated_date, len(build.flaws))
+
+    def export_builds():
+        try:
+            data = data_loader.plan_data(include_static_builds, include_dynamic_builds, include_sandboxes=include_sandboxes,
+                                         selector=selector)
+            if args.plan:
+                for line in data_loader.plan.to_lines():
+                    print(line)
+                return
+            logging.log(logging.INFO, data_loader.plan.summary())
+            # Every run claims its builds, so that a share run overlapping an exit run skips the builds it is fetching
+            data = data_loader.claim_builds(data)
+            data = data_loader.fetch_data(data, fetch_workers)
+        except VeracodeError:
+            if budget.expired():
+                logging.exception("Time budget used up while getting app data")
+                print("Time budget used up while getting app data, remaining builds are left for the next run.")
+                data = []
+            else:
+                print("Failed to get app data, check log file for details.")
+                raise
+
+        logging.log(logging.INFO, "Writing CSV files")
+        print("Writing CSV files")
+
+        for app in data:
+            # Iterate over policy builds
+            for build in app.builds:
+                try:
+                    process_build(app, build)
+                except VeracodeError:
+                    logging.exception("Failed to process build")
+
+            # Iterate over sandbox builds
+            if include_sandboxes:
+                for sandbox in app.sandboxes:
+                    for build in sandbox.builds:
+                        try:
+                            process_build(app, build, sandbox)
+                        except VeracodeError:
+                            logging.exception("Failed to process build")
+
+        try:
+            build_tools.save_processed_builds_file()
+        except VeracodeError:
+            print("Error saving processed build history, check log file for details.")
+            raise
+
+    def run_cycle():
+        budget.restart()
+        try:
+            export_builds()
+        finally:
+            if not args.plan:
+                try:
+                    build_tools.release_claims()
+                except VeracodeError:
+                    logging.exception("Failed to release build claims")
+
+    if args.plan or not watch_interval:
+        try:
+            run_cycle()
+        except VeracodeError:
+            sys.exit(2)
+        return
+
+    # Watch mode keeps the API session, processed build history and config in memory between cycles
+    while True:
+        try:
+            run_cycle()
+        except Exception:
+            # One bad response should not stop a long running process, KeyboardInterrupt still gets through
+            logging.exception("Watch cycle failed")
+            print("Watch cycle failed, check log file for details.")
+        # Jitter spreads the polls of several instances so they don't hit the API at the same moment
+        delay = watch_interval * 60 * (1 + random.uniform(-watch_jitter, watch_jitter))
+        logging.log(logging.INFO, "Next check in {:.0f} seconds".format(delay))
+        print("Next check in {:.0f} seconds".format(delay))
+        time.sleep(delay)
 
 
 def run():